@@ -1,27 +1,48 @@
 import os
 import subprocess
 
-def build_app():
-    try:
-        # Ensure both files are in the current directory
-        if not os.path.exists("GUIFile.py") or not os.path.exists("parabolic.py"):
-            raise FileNotFoundError("Ensure GUI File.py and parabolic.py are in the current directory")
-
-        # PyInstaller command to build the executable
-        command = [
-            "pyinstaller",
+# Two executables are built:
+#   VerticalParabolicCurveCalculator  the PyQt6 GUI (single file, windowed)
+#   VerticalCurveCLI                  the headless batch tool (curve_cli.py) built as a
+#                                     folder, so it starts without unpacking an archive and
+#                                     without Qt, which is excluded from the bundle
+BUILDS = [
+    {
+        "script": "GUI File.py",
+        "options": [
             "--onefile",  # Create a single executable file
             "--windowed",  # Run as a GUI application (no console on Windows)
             "--name=VerticalParabolicCurveCalculator",  # Name of the executable
-            "--add-data=parabolic.py;.",  # Include parabolic.py (syntax for Windows; use : for macOS/Linux)
-            "--clean"   #Clear cache for fresh build
-            "GUIFile.py"  # Main script
-        ]
+        ],
+    },
+    {
+        "script": "curve_cli.py",
+        "options": [
+            "--onedir",  # No per-run unpacking, for fast startup
+            "--console",
+            "--name=VerticalCurveCLI",
+            "--exclude-module=PyQt6",
+            "--exclude-module=tkinter",
+        ],
+    },
+]
+
+def build_app():
+    try:
+        # Ensure the scripts and the core module are in the current directory
+        for name in ["parabolic.py"] + [build["script"] for build in BUILDS]:
+            if not os.path.exists(name):
+                raise FileNotFoundError(f"Ensure {name} is in the current directory")
+
+        for build in BUILDS:
+            # PyInstaller command to build the executable; imported modules such as
+            # parabolic.py are collected automatically
+            command = ["pyinstaller", "--noconfirm", "--clean"] + build["options"] + [build["script"]]
 
-        # Run PyInstaller
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        print("Build successful! Executable createsd in dist/VerticalCurveCalculator")
-        print(result.stdout)
+            # Run PyInstaller
+            result = subprocess.run(command, check=True, capture_output=True, text=True)
+            print(f"Build successful! {build['script']} packaged in dist/")
+            print(result.stdout)
     except FileNotFoundError as e:
         print(f"Error: {e}")
     except subprocess.CalledProcessError as e:
@@ -1,42 +1,167 @@
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QFormLayout, QLineEdit, QPushButton, QLabel
-from PyQt6.QtGui import QPainter, QPen, QColor
-from PyQt6.QtCore import Qt
+import numpy as np
+from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QFormLayout, QLineEdit, QPushButton, QLabel, QProgressBar
+from PyQt6.QtGui import QPainter, QPainterPath, QPen, QColor, QPolygonF, QTransform
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
 from parabolic import VerticalParabolicCurve, VerticalPoint, VerticalCurveType
+from sampling import chord_count, elevation_extents, sample
+
+def curve_path(curve, max_error, max_points):
+    'Sample a curve or profile into a QPainterPath in station/elevation coordinates'
+    return polyline_path(*sample(curve, max_error, max_points))
+
+def polygon(stations, elevations):
+    'Build a QPolygonF from arrays of stations and elevations'
+    # QPointF is a pair of doubles, so the coordinates are written straight into the
+    # polygon's storage instead of creating a QPointF per point
+    result = QPolygonF()
+    result.resize(len(stations))
+    buffer = result.data()
+    buffer.setsize(16 * len(stations))
+    points = np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+    points[:, 0] = stations
+    points[:, 1] = elevations
+    return result
+
+def polyline_path(stations, elevations):
+    'Build a QPainterPath through sampled stations and elevations'
+    path = QPainterPath()
+    path.addPolygon(polygon(stations, elevations))
+    return path
 
 class CurveCanvas(QWidget):
+    # Draws a VerticalParabolicCurve or a VerticalProfile.
+    # The curve polyline is cached as a QPainterPath in station/elevation coordinates and
+    # only rebuilt when the curve changes (its revision) or the window needs finer sampling;
+    # each repaint just maps the cached path to the screen. For a VerticalProfile the canvas
+    # subscribes to its edits and resamples only the station range each edit reports,
+    # splicing the new samples into the cached ones.
+    CHORD_TOLERANCE = 0.25  # Largest allowed gap in pixels between the polyline and the curve
+
     def __init__(self, curve, parent=None):
         super().__init__(parent)
         self.curve = curve
         self.calc_station = None
         self.calc_elevation = None
+        self._geometry_key = None
+        self._extents = None
+        self._markers = []
+        self._path = None
+        self._path_error = None
+        self._max_points = None
+        self._path_capped = False
+        self._samples = None
+        self._changes = []
+        self._watched = None
+        self._watch(curve)
         self.setMinimumSize(400, 400)
 
+    def _watch(self, curve):
+        'Subscribe to the edits of a VerticalProfile (and stop following the previous one)'
+        if self._watched is not None:
+            self._watched.unsubscribe(self._profile_changed)
+            self._watched = None
+        self._changes = []
+        if hasattr(curve, 'subscribe'):
+            self._watched = curve
+            curve.subscribe(self._profile_changed)
+
+    def _profile_changed(self, change):
+        self._changes.append(change)
+        self.update()
+
+    def set_curve(self, curve, path=None, path_error=None, path_points=None):
+        'Show another curve, optionally with a path that was already sampled (e.g. by a CurveJob) and its point budget'
+        if curve is not self._watched:
+            self._watch(curve)
+        self.curve = curve
+        self._update_geometry()
+        if path is not None:
+            self._path = path
+            self._path_error = path_error
+            self._samples = None
+            self._max_points = path_points
+            self._path_capped = path_points is not None and chord_count(curve, path_error) > path_points
+        self.update()
+
+    def _update_geometry(self):
+        'Rebuild the cached extents and markers when the curve has changed'
+        key = (id(self.curve), getattr(self.curve, 'revision', 0))
+        if key == self._geometry_key:
+            return
+        if not self._splice_changes(key):
+            self._path = None
+            self._samples = None
+        self._changes = []
+        self._geometry_key = key
+        starts, ends, _, _, _ = self.curve.pieces()
+        self._extents = (float(starts[0]), float(ends[-1])) + elevation_extents(self.curve)
+        if isinstance(self.curve, VerticalParabolicCurve):
+            pvis = [self.curve.PVI]
+            markers = [(Qt.GlobalColor.red, [self.curve.PVC, self.curve.PVT]), (Qt.GlobalColor.green, pvis)]
+            if self.curve.High_low_point:
+                markers.append((Qt.GlobalColor.magenta, [self.curve.High_low_point]))
+            markers = [(color, [p.station for p in points], [p.elevation for p in points]) for color, points in markers]
+            pvi_elevations = [self.curve.PVI.elevation]
+        else:
+            pvi_elevations = self.curve.pvi_elevations
+            markers = [(Qt.GlobalColor.green, self.curve.pvi_stations, pvi_elevations)]
+        # Markers are kept as one polygon per color in curve coordinates, like the curve path
+        self._markers = [(color, polygon(stations, elevations)) for color, stations, elevations in markers]
+        self._extents = self._extents[:2] + (min(self._extents[2], float(np.min(pvi_elevations))),
+                                             max(self._extents[3], float(np.max(pvi_elevations))))
+
+    def _splice_changes(self, key):
+        'Resample only the station ranges of the profile edits made since the path was sampled'
+        if self._samples is None or self._geometry_key is None or key[0] != self._geometry_key[0]:
+            return False
+        if [change.revision for change in self._changes] != list(range(self._geometry_key[1] + 1, key[1] + 1)):
+            return False
+        stations, elevations = self._samples
+        for change in self._changes:
+            first = np.searchsorted(stations, change.start, side='left')
+            last = np.searchsorted(stations, change.end, side='right')
+            new_stations, new_elevations = sample(self.curve, self._path_error, self._max_points, change.start, change.end)
+            stations = np.concatenate((stations[:first], new_stations, stations[last:]))
+            elevations = np.concatenate((elevations[:first], new_elevations, elevations[last:]))
+        self._samples = stations, elevations
+        self._path = polyline_path(stations, elevations)
+        return True
+
+    def _update_path(self, max_error, max_points):
+        'Resample the curve into the cached path when the current one is too coarse'
+        # A path limited by its point budget is also refined when the window gets wider
+        wider = self._path_capped and max_points is not None and max_points > self._max_points
+        if self._path is not None and max_error >= self._path_error / 2 and not wider:
+            return
+        self._samples = sample(self.curve, max_error, max_points)
+        self._path = polyline_path(*self._samples)
+        self._path_error = max_error
+        self._max_points = max_points
+        self._path_capped = max_points is not None and chord_count(self.curve, max_error) > max_points
+
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.fillRect(self.rect(), Qt.GlobalColor.white)
 
-        if not self.curve._data.is_initialized:
+        if not getattr(self.curve, 'is_initialized', True):
             return
 
         width = self.width()
         height = self.height()
-        pvc = self.curve.PVC
-        pvt = self.curve.PVT
-        pvi = self.curve.PVI
-        high_low = self.curve.High_low_point
+        self._update_geometry()
+        first_station, last_station, low, high = self._extents
 
         # Determine plot ranges
-        min_station = pvc.station - 0.1 * (pvt.station - pvc.station)
-        max_station = pvt.station + 0.1 * (pvt.station - pvc.station)
-        elevations = [self.curve.elevation_at(pvc.station + i * (pvt.station - pvc.station) / 49) for i in range(50)]
-        if high_low:
-            elevations.append(high_low.elevation)
+        min_station = first_station - 0.1 * (last_station - first_station)
+        max_station = last_station + 0.1 * (last_station - first_station)
         if self.calc_elevation is not None:
-            elevations.append(self.calc_elevation)
-        elevations.append(pvi.elevation)  # Include PVI elevation
-        min_elev = min(elevations) - 0.1 * (max(elevations) - min(elevations))
-        max_elev = max(elevations) + 0.1 * (max(elevations) - min(elevations))
+            low = min(low, self.calc_elevation)
+            high = max(high, self.calc_elevation)
+        min_elev = low - 0.1 * (high - low)
+        max_elev = high + 0.1 * (high - low)
+        if max_elev == min_elev:
+            min_elev, max_elev = min_elev - 1, max_elev + 1
 
         x_scale = (width - 100) / (max_station - min_station)
         y_scale = (height - 100) / (max_elev - min_elev) * 1.2  # Stretch y-axis for taller curve
@@ -73,30 +198,16 @@ class CurveCanvas(QWidget):
             painter.drawLine(y_axis_x - 5, int(y), y_axis_x + 5, int(y))
             painter.drawText(y_axis_x - 40, int(y) + 5, f"{elev:.1f}")
 
-        # Draw curve (connects PVC and PVT)
+        # Draw curve from the cached path, sampled finely enough for the current scale
+        self._update_path(self.CHORD_TOLERANCE / y_scale, 4 * width)
         painter.setPen(QPen(Qt.GlobalColor.blue, 2))
-        points = []
-        for i in range(50):
-            station = pvc.station + (pvt.station - pvc.station) * i / 49
-            elev = self.curve.elevation_at(station)
-            x, y = to_screen(station, elev)
-            points.append((x, y))
-        for i in range(len(points) - 1):
-            painter.drawLine(int(points[i][0]), int(points[i][1]), int(points[i+1][0]), int(points[i+1][1]))
+        transform = QTransform(x_scale, 0, 0, -y_scale, 50 - min_station * x_scale, height - 50 + min_elev * y_scale)
+        painter.drawPath(transform.map(self._path))
 
         # Draw points (larger dots)
-        painter.setPen(QPen(Qt.GlobalColor.red, 8))
-        x, y = to_screen(pvc.station, pvc.elevation)
-        painter.drawPoint(int(x), int(y))
-        x, y = to_screen(pvt.station, pvt.elevation)
-        painter.drawPoint(int(x), int(y))
-        painter.setPen(QPen(Qt.GlobalColor.green, 8))
-        x, y = to_screen(pvi.station, pvi.elevation)
-        painter.drawPoint(int(x), int(y))
-        if high_low:
-            painter.setPen(QPen(Qt.GlobalColor.magenta, 8))
-            x, y = to_screen(high_low.station, high_low.elevation)
-            painter.drawPoint(int(x), int(y))
+        for color, points in self._markers:
+            painter.setPen(QPen(color, 8))
+            painter.drawPoints(transform.map(points))
         if self.calc_station is not None and self.calc_elevation is not None:
             painter.setPen(QPen(Qt.GlobalColor.black, 8))
             x, y = to_screen(self.calc_station, self.calc_elevation)
@@ -125,12 +236,79 @@ class CurveCanvas(QWidget):
         painter.setPen(QPen(Qt.GlobalColor.black, 1))
         painter.drawText(legend_x, legend_y + 80, "Black: Calc Point")
 
+class CurveJobSignals(QObject):
+    progress = pyqtSignal(int, int)     # job id, percent done
+    finished = pyqtSignal(int, object)  # job id, result dict
+    failed = pyqtSignal(int, str)       # job id, error message
+
+
+class CurveJob(QRunnable):
+    # Solves a curve, evaluates the query stations and samples the canvas path on a
+    # worker thread. Results come back to the UI thread through the signals; a
+    # cancelled job stops at the next chunk and reports nothing.
+    CHUNK = 100000  # Stations evaluated between progress reports and cancellation checks
+
+    def __init__(self, job_id, inputs, stations, canvas_size):
+        super().__init__()
+        self.job_id = job_id
+        self.inputs = inputs
+        self.stations = stations
+        self.canvas_size = canvas_size
+        self.signals = CurveJobSignals()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            result = self._compute()
+        except ValueError as e:
+            if not self._cancelled:
+                self.signals.failed.emit(self.job_id, str(e))
+            return
+        except Exception as e:  # Anything else would be lost on the pool thread and leave the progress bar up
+            if not self._cancelled:
+                self.signals.failed.emit(self.job_id, f"Unexpected error: {type(e).__name__}: {e}")
+            return
+        if result is not None and not self._cancelled:
+            self.signals.finished.emit(self.job_id, result)
+
+    def _compute(self):
+        station, elevation, g1, g2, length = self.inputs
+        curve = VerticalParabolicCurve().configure(PVI=VerticalPoint(station, elevation), g1=g1, g2=g2, Length=length)
+        if not curve.is_initialized:
+            raise ValueError("Curve length must be positive")
+        stations = np.asarray(self.stations, dtype=float)
+        elevations = np.empty_like(stations)
+        slopes = np.empty_like(stations)
+        for start in range(0, len(stations), self.CHUNK):
+            if self._cancelled:
+                return None
+            stop = start + self.CHUNK
+            elevations[start:stop] = curve.elevations_at(stations[start:stop])
+            slopes[start:stop] = curve.slopes_at(stations[start:stop])
+            self.signals.progress.emit(self.job_id, int(90 * min(stop, len(stations)) / len(stations)))
+        if self._cancelled:
+            return None
+        width, height = self.canvas_size
+        low, high = elevation_extents(curve)
+        max_error = CurveCanvas.CHORD_TOLERANCE * max(high - low, 1e-9) / max(height - 100, 1)
+        path = curve_path(curve, max_error, 4 * width)
+        self.signals.progress.emit(self.job_id, 100)
+        return {'curve': curve, 'stations': stations, 'elevations': elevations, 'slopes': slopes,
+                'path': path, 'path_error': max_error, 'path_points': 4 * width}
+
+
 class VerticalCurveGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Vertical Parabolic Curve Calculator")
         self.setGeometry(100, 100, 600, 600)
         self.curve = VerticalParabolicCurve()
+        self.pool = QThreadPool.globalInstance()
+        self._job = None
+        self._job_id = 0
         self.setup_ui()
 
     def setup_ui(self):
@@ -147,8 +325,12 @@ class VerticalCurveGUI(QMainWindow):
         self.g2 = QLineEdit("-0.03")
         self.length = QLineEdit("200.0")
         self.calc_station = QLineEdit("1000.0")
+        self.calc_station.setToolTip("One or more stations separated by commas or spaces")
         self.calculate_button = QPushButton("Calculate")
         self.calculate_button.clicked.connect(self.calculate)
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        self.progress.hide()
         form_layout.addRow("PVI Station:", self.pvi_station)
         form_layout.addRow("PVI Elevation:", self.pvi_elevation)
         form_layout.addRow("Grade 1 (g1):", self.g1)
@@ -156,6 +338,7 @@ class VerticalCurveGUI(QMainWindow):
         form_layout.addRow("Curve Length:", self.length)
         form_layout.addRow("Calc Station:", self.calc_station)
         form_layout.addRow(self.calculate_button)
+        form_layout.addRow(self.progress)
 
         # Result labels
         self.pvc_label = QLabel("PVC: Not calculated")
@@ -186,43 +369,81 @@ class VerticalCurveGUI(QMainWindow):
             g1 = float(self.g1.text())
             g2 = float(self.g2.text())
             length = float(self.length.text())
-            calc_station = float(self.calc_station.text())
-
-            self.curve.PVI = VerticalPoint(station, elevation)
-            self.curve.g1 = g1
-            self.curve.g2 = g2
-            self.curve.Length = length
-
-            self.pvc_label.setText(f"PVC: Station {self.curve.PVC.station:.2f}, Elevation {self.curve.PVC.elevation:.2f}")
-            self.pvt_label.setText(f"PVT: Station {self.curve.PVT.station:.2f}, Elevation {self.curve.PVT.elevation:.2f}")
-            self.pvi_label.setText(f"PVI: Station {self.curve.PVI.station:.2f}, Elevation {self.curve.PVI.elevation:.2f}")
-            self.curve_type_label.setText(f"Curve Type: {self.curve.Curve_type.name if self.curve.Curve_type else 'None'}")
-            high_low = self.curve.High_low_point
-            self.high_low_label.setText(f"High/Low Point: ({high_low.station:.2f}, {high_low.elevation:.2f})" if high_low else "High/Low Point: None")
-            distance = self.curve.distance_to_High_low_point()
-            self.distance_label.setText(f"Distance to High/Low: {distance:.2f}" if distance is not None else "Distance to High/Low: None")
-            calc_elevation = self.curve.elevation_at(calc_station)
-            calc_slope = self.curve.slope_at(calc_station) 
-            self.elevation_label.setText(f"Elevation at Station {calc_station:.2f}: {calc_elevation:.2f}" if calc_elevation is not None else f"Elevation at Station {calc_station:.2f}: Invalid station")
-            self.slope_label.setText(f"Slope at Station {calc_station:.2f}: {calc_slope*100:.2f}%" if calc_slope is not None else f"Slope at Station {calc_station:.2f}: Invalid station")
-            self.canvas.calc_station = calc_station
-            self.canvas.calc_elevation = calc_elevation
-            self.canvas.update()
+            calc_stations = [float(s) for s in self.calc_station.text().replace(',', ' ').split()]
+            if not calc_stations:
+                raise ValueError("Enter at least one calc station")
         except ValueError as e:
-            self.pvc_label.setText(f"Error: {str(e)}")
-            self.pvt_label.setText("")
-            self.pvi_label.setText("")
-            self.curve_type_label.setText("")
-            self.high_low_label.setText("")
-            self.distance_label.setText("")
-            self.elevation_label.setText("")
-            self.slope_label.setText("")
-            self.canvas.calc_station = None
-            self.canvas.calc_elevation = None
-            self.canvas.update()
+            self.show_error(str(e))
+            return
+
+        # A new request makes any running one stale
+        if self._job is not None:
+            self._job.cancel()
+        self._job_id += 1
+        self._job = CurveJob(self._job_id, (station, elevation, g1, g2, length), calc_stations,
+                             (self.canvas.width(), self.canvas.height()))
+        self._job.signals.progress.connect(self.on_progress)
+        self._job.signals.finished.connect(self.on_finished)
+        self._job.signals.failed.connect(self.on_failed)
+        self.progress.setValue(0)
+        self.progress.show()
+        self.pool.start(self._job)
+
+    def on_progress(self, job_id, percent):
+        if job_id == self._job_id:
+            self.progress.setValue(percent)
+
+    def on_failed(self, job_id, message):
+        if job_id != self._job_id:
+            return
+        self._job = None
+        self.progress.hide()
+        self.show_error(message)
+
+    def on_finished(self, job_id, result):
+        if job_id != self._job_id:
+            return
+        self._job = None
+        self.progress.hide()
+        self.curve = result['curve']
+        self.pvc_label.setText(f"PVC: Station {self.curve.PVC.station:.2f}, Elevation {self.curve.PVC.elevation:.2f}")
+        self.pvt_label.setText(f"PVT: Station {self.curve.PVT.station:.2f}, Elevation {self.curve.PVT.elevation:.2f}")
+        self.pvi_label.setText(f"PVI: Station {self.curve.PVI.station:.2f}, Elevation {self.curve.PVI.elevation:.2f}")
+        self.curve_type_label.setText(f"Curve Type: {self.curve.Curve_type.name if self.curve.Curve_type else 'None'}")
+        high_low = self.curve.High_low_point
+        self.high_low_label.setText(f"High/Low Point: ({high_low.station:.2f}, {high_low.elevation:.2f})" if high_low else "High/Low Point: None")
+        distance = self.curve.distance_to_High_low_point()
+        self.distance_label.setText(f"Distance to High/Low: {distance:.2f}" if distance is not None else "Distance to High/Low: None")
+
+        # The labels show the first calc station; further stations are summarised
+        stations, elevations, slopes = result['stations'], result['elevations'], result['slopes']
+        calc_station = float(stations[0])
+        calc_elevation = None if np.isnan(elevations[0]) else float(elevations[0])
+        calc_slope = None if np.isnan(slopes[0]) else float(slopes[0])
+        more = ""
+        if len(stations) > 1:
+            more = f" (+{len(stations) - 1} stations, {int(np.count_nonzero(np.isnan(elevations)))} invalid)"
+        self.elevation_label.setText((f"Elevation at Station {calc_station:.2f}: {calc_elevation:.2f}" if calc_elevation is not None else f"Elevation at Station {calc_station:.2f}: Invalid station") + more)
+        self.slope_label.setText(f"Slope at Station {calc_station:.2f}: {calc_slope*100:.2f}%" if calc_slope is not None else f"Slope at Station {calc_station:.2f}: Invalid station")
+        self.canvas.calc_station = calc_station
+        self.canvas.calc_elevation = calc_elevation
+        self.canvas.set_curve(self.curve, result['path'], result['path_error'], result['path_points'])
+
+    def show_error(self, message):
+        self.pvc_label.setText(f"Error: {message}")
+        self.pvt_label.setText("")
+        self.pvi_label.setText("")
+        self.curve_type_label.setText("")
+        self.high_low_label.setText("")
+        self.distance_label.setText("")
+        self.elevation_label.setText("")
+        self.slope_label.setText("")
+        self.canvas.calc_station = None
+        self.canvas.calc_elevation = None
+        self.canvas.update()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = VerticalCurveGUI()
     window.show()
-    sys.exit(app.exec())
+    sys.exit(app.exec())
\ No newline at end of file
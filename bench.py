@@ -0,0 +1,248 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import parabolic
+import sampling
+from curve_cache import CurveSolutionCache
+from parabolic import VerticalParabolicCurve, VerticalPoint
+from vertical_profile import VerticalProfile
+
+# Reproducible benchmarks for parabolic.py.
+#
+# Every case runs on synthetic curves generated from a fixed seed and reports
+# seconds, operations per second and (unless --no-memory) the peak traced memory
+# of a separate run. Results are printed as a table on stderr and written as JSON
+# (stdout or --json PATH); --compare OLD.json prints the speed ratio per case.
+
+DEFAULT_SIZES=(1,1000,1000000)
+
+
+def synthetic_inputs(count:int, seed:int) ->dict:
+    'Generate PVI stations/elevations, grades and lengths for count curves (and the seed, for cases that need more)'
+    rng=np.random.default_rng(seed)
+    lengths=rng.uniform(50,600,count)
+    stations=np.cumsum(rng.uniform(700,1500,count))
+    return {'pvi_station':stations,'pvi_elevation':rng.uniform(50,500,count),
+            'g1':rng.uniform(-0.06,0.06,count),'g2':rng.uniform(-0.06,0.06,count),'length':lengths,
+            'fraction':rng.uniform(0,1,count),'ground':rng.uniform(-5,5,count),'seed':seed}
+
+
+def build_curves(data:dict) ->list:
+    'Create one VerticalParabolicCurve per synthetic curve'
+    curves=[]
+    for s,e,g1,g2,L in zip(data['pvi_station'].tolist(),data['pvi_elevation'].tolist(),data['g1'].tolist(),data['g2'].tolist(),data['length'].tolist()):
+        curve=VerticalParabolicCurve()
+        curve.PVI=VerticalPoint(s,e)
+        curve.Length=L
+        curve.g1=g1
+        curve.g2=g2
+        curve.PVC
+        curves.append(curve)
+    return curves
+
+
+def _single_curve(data:dict) ->VerticalParabolicCurve:
+    return VerticalParabolicCurve().configure(PVI=VerticalPoint(float(data['pvi_station'][0]),float(data['pvi_elevation'][0])),
+                                              g1=float(data['g1'][0]),g2=float(data['g2'][0]),Length=float(data['length'][0]))
+
+
+def _query_stations(curve:VerticalParabolicCurve, data:dict) ->np.ndarray:
+    return curve.PVC.station+data['fraction']*curve.Length
+
+
+def canvas_samples(design, width:int=600, height:int=600):
+    'Reproduce the sampling CurveCanvas does when its cached path has to be rebuilt'
+    low,high=sampling.elevation_extents(design)
+    y_scale=(height-100)/max(high-low,1e-9)
+    return sampling.sample(design,0.25/y_scale,4*width)
+
+
+def _case_construct(data):
+    def run():
+        build_curves(data)
+    return run
+
+
+def _case_update_curve(data):
+    curves=build_curves(data)
+    def run():
+        for curve in curves:
+            curve._update_curve()
+    return run
+
+
+def _case_scalar(method:str):
+    def case(data):
+        curve=_single_curve(data)
+        stations=_query_stations(curve,data).tolist()
+        evaluate=getattr(curve,method)
+        def run():
+            for station in stations:
+                evaluate(station)
+        return run
+    return case
+
+
+def _case_project(data):
+    curve=_single_curve(data)
+    stations=_query_stations(curve,data)
+    points=[VerticalPoint(s,curve.elevation_at(s)+d) for s,d in zip(stations.tolist(),data['ground'].tolist())]
+    def run():
+        for point in points:
+            curve.projectpoint_at(point)
+    return run
+
+
+def _case_batch(method:str):
+    def case(data):
+        curve=_single_curve(data)
+        stations=_query_stations(curve,data)
+        evaluate=getattr(curve,method)
+        def run():
+            evaluate(stations)
+        return run
+    return case
+
+
+def _case_offset_curve(data):
+    curve=_single_curve(data)
+    offsets=data['ground'].tolist()
+    def run():
+        for offset in offsets:
+            curve.create_offset_curve(offset).PVC
+    return run
+
+
+def _case_canvas(data):
+    # One repaint of a profile with `size` PVIs (at least two)
+    count=max(len(data['length']),2)
+    if count>len(data['length']):
+        data=synthetic_inputs(count,data['seed'])
+    lengths=data['length'].copy()
+    lengths[[0,-1]]=0
+    profile=VerticalProfile.from_arrays(data['pvi_station'],data['pvi_elevation'],lengths)
+    def run():
+        canvas_samples(profile)
+    return run
+
+
+def _library_inputs(data, distinct:int=1000) ->list:
+    'Inputs cycling over a library of distinct curves, as when the same designs are solved repeatedly'
+    rows=list(zip(*(data[k][:distinct].tolist() for k in ('pvi_station','pvi_elevation','g1','g2','length'))))
+    count=len(data['length'])
+    return (rows*(count//len(rows)+1))[:count]
+
+
+def _case_solve_objects(data):
+    inputs=_library_inputs(data)
+    def run():
+        for s,e,g1,g2,L in inputs:
+            VerticalParabolicCurve().configure(PVI=VerticalPoint(s,e),g1=g1,g2=g2,Length=L).solution()
+    return run
+
+
+def _case_solve_cached(data):
+    inputs=_library_inputs(data)
+    cache=CurveSolutionCache()
+    def run():
+        for s,e,g1,g2,L in inputs:
+            cache.solve(VerticalPoint(s,e),g1,g2,L)
+    return run
+
+
+# name -> (setup returning a callable that performs `size` operations)
+CASES={
+    'construct_setters':_case_construct,
+    'update_curve':_case_update_curve,
+    'elevation_at':_case_scalar('elevation_at'),
+    'slope_at':_case_scalar('slope_at'),
+    'projectpoint_at':_case_project,
+    'elevations_at_batch':_case_batch('elevations_at'),
+    'slopes_at_batch':_case_batch('slopes_at'),
+    'create_offset_curve':_case_offset_curve,
+    'solve_objects':_case_solve_objects,
+    'solve_cached':_case_solve_cached,
+    'canvas_paint_sampling':_case_canvas,
+}
+
+
+def run_case(name:str, size:int, seed:int, repeat:int, memory:bool) ->dict:
+    'Time one case at one size and return its result record'
+    data=synthetic_inputs(size,seed)
+    run=CASES[name](data)
+    best=float('inf')
+    for _ in range(repeat):
+        start=time.perf_counter()
+        run()
+        best=min(best,time.perf_counter()-start)
+    peak=None
+    if memory:
+        run=CASES[name](data)
+        tracemalloc.start()
+        run()
+        peak=tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'name':name,'size':size,'seconds':best,'ops_per_sec':size/best if best>0 else float('inf'),'peak_bytes':peak}
+
+
+def _revision() ->str:
+    try:
+        return subprocess.run(['git','rev-parse','--short','HEAD'],capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main(argv=None) ->int:
+    parser=argparse.ArgumentParser(description="Benchmark vertical curve construction and evaluation")
+    parser.add_argument('--sizes',default=','.join(map(str,DEFAULT_SIZES)),help="comma separated curve counts")
+    parser.add_argument('--cases',default=','.join(CASES),help="comma separated case names")
+    parser.add_argument('--seed',type=int,default=12345)
+    parser.add_argument('--repeat',type=int,default=3,help="timed runs per case (the best is kept)")
+    parser.add_argument('--no-memory',action='store_true',help="skip the peak memory run")
+    parser.add_argument('--json',help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--compare',help="JSON report of another revision to compare against")
+    args=parser.parse_args(argv)
+
+    sizes=[int(s) for s in args.sizes.split(',') if s]
+    names=[n for n in args.cases.split(',') if n]
+    unknown=set(names)-set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    baseline={}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline={(r['name'],r['size']):r for r in json.load(f)['results']}
+
+    results=[]
+    for name in names:
+        for size in sizes:
+            result=run_case(name,size,args.seed,args.repeat,not args.no_memory)
+            results.append(result)
+            line=f"{name:24} {size:>9} {result['ops_per_sec']:>14,.0f} ops/s"
+            if result['peak_bytes'] is not None:
+                line+=f" {result['peak_bytes']/2**20:>10.2f} MiB"
+            old=baseline.get((name,size))
+            if old:
+                line+=f"  x{result['ops_per_sec']/old['ops_per_sec']:.2f} vs {args.compare}"
+            print(line,file=sys.stderr)
+
+    report={'meta':{'revision':_revision(),'python':platform.python_version(),'numpy':np.__version__,
+                    'platform':platform.platform(),'seed':args.seed,'repeat':args.repeat,'module':parabolic.__file__},
+            'results':results}
+    if args.json:
+        with open(args.json,'w') as f:
+            json.dump(report,f,indent=2)
+    else:
+        json.dump(report,sys.stdout,indent=2)
+        print()
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
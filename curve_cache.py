@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from parabolic import CurveSolution, VerticalParabolicCurve, VerticalPoint
+
+
+class CurveSolutionCache:
+    # Bounded LRU memo of derived curve geometry keyed by the curve inputs
+    #
+    # Inputs are snapped to a grid (station_tolerance for PVI station/elevation and
+    # length, grade_tolerance for the grades) so float noise maps to the same key.
+    # A hit in solve() returns the shared CurveSolution without building a
+    # VerticalParabolicCurve; the curve's own recomputation is a handful of float
+    # operations, cheaper than any lookup, so curves do not consult the cache.
+
+    def __init__(self, capacity:int=4096, station_tolerance:float=1e-6, grade_tolerance:float=1e-9):
+        "Create an empty cache holding at most capacity solutions"
+        if capacity<=0:
+            raise ValueError("Cache capacity must be positive")
+        if station_tolerance<=0 or grade_tolerance<=0:
+            raise ValueError("Cache tolerances must be positive")
+        self.capacity=capacity
+        self.station_tolerance=station_tolerance
+        self.grade_tolerance=grade_tolerance
+        self._station_scale=1/station_tolerance
+        self._grade_scale=1/grade_tolerance
+        self._entries=OrderedDict()
+        self._lock=Lock()
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+    def key(self, pvi_station:float, pvi_elevation:float, g1:float, g2:float, length:float) ->tuple:
+        'Build the normalized cache key of a set of curve inputs'
+        s=self._station_scale
+        g=self._grade_scale
+        return (round(pvi_station*s), round(pvi_elevation*s), round(g1*g), round(g2*g), round(length*s))
+
+    def get(self, key:tuple) ->Optional[CurveSolution]:
+        'Look up a solution and mark it as recently used, None on a miss'
+        with self._lock:
+            solution=self._entries.get(key)
+            if solution is None:
+                self.misses+=1
+                return None
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return solution
+
+    def put(self, key:tuple, solution:CurveSolution):
+        'Store a solution, evicting the least recently used one when full'
+        with self._lock:
+            self._entries[key]=solution
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions+=1
+
+    def solve(self, PVI:VerticalPoint, g1:float, g2:float, Length:float) ->CurveSolution:
+        'Get the derived geometry of a curve, building the curve only on a miss'
+        key=self.key(PVI.station, PVI.elevation, g1, g2, Length)
+        solution=self.get(key)
+        if solution is None:
+            solution=VerticalParabolicCurve().configure(PVI=PVI, g1=g1, g2=g2, Length=Length).solution()
+            self.put(key, solution)
+        return solution
+
+    def clear(self):
+        'Drop all cached solutions and reset the counters'
+        with self._lock:
+            self._entries.clear()
+            self.hits=self.misses=self.evictions=0
+
+    def __len__(self) ->int:
+        return len(self._entries)
+
+    def stats(self) ->dict:
+        'Get the hit, miss and eviction counters'
+        lookups=self.hits+self.misses
+        return {'capacity':self.capacity, 'size':len(self._entries), 'hits':self.hits, 'misses':self.misses,
+                'evictions':self.evictions, 'hit_rate':self.hits/lookups if lookups else 0.0}
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+import numpy as np
+from curveset import CurveSet
+from parabolic import VerticalCurveType
+
+# Headless batch entry point: reads curve definitions from CSV or NDJSON and
+# writes the curve components (and elevations at optional query stations) in
+# input order, one chunk at a time so memory stays bounded.
+#
+# Input fields: pvi_station, pvi_elevation, g1, g2, length, optional id and
+# optional stations (a list in NDJSON, separated by ';' or spaces in CSV).
+
+INPUT_FIELDS=('pvi_station','pvi_elevation','g1','g2','length')
+OUTPUT_FIELDS=('id','pvc_station','pvc_elevation','pvt_station','pvt_elevation','curve_type',
+               'high_low_station','high_low_elevation','stations','elevations','error')
+
+
+def _parse_json(line:str):
+    'Parse one NDJSON record, returning the exception instead of raising it for a malformed line'
+    try:
+        record=json.loads(line)
+    except ValueError as e:
+        return e
+    if not isinstance(record,dict):
+        return TypeError("record must be a JSON object")
+    return record
+
+
+def _parse_stations(value) ->List[float]:
+    'Parse the optional query stations of a record'
+    if value is None or value=='':
+        return []
+    if isinstance(value,str):
+        return [float(v) for v in value.replace(';',' ').split()]
+    if isinstance(value,(list,tuple)):
+        return [float(v) for v in value]
+    return [float(value)]
+
+
+def _number(value) ->Optional[float]:
+    return None if math.isnan(value) else float(value)
+
+
+def solve_chunk(records:List[dict]) ->List[dict]:
+    'Compute the curve components for a chunk of raw records (exceptions stand for lines that could not be parsed)'
+    results=[{'id':r.get('id') if isinstance(r,dict) else None} for r in records]
+    rows=[]
+    queries=[]
+    valid=[]
+    for i,record in enumerate(records):
+        try:
+            if isinstance(record,Exception):
+                raise record
+            row=[float(record[name]) for name in INPUT_FIELDS]
+            stations=_parse_stations(record.get('stations'))
+            if row[4]<=0:
+                raise ValueError("length must be positive")
+        except (KeyError,TypeError,ValueError) as e:
+            results[i]['error']=f"{type(e).__name__}: {e}"
+            continue
+        rows.append(row)
+        queries.append(stations)
+        valid.append(i)
+    if not rows:
+        return results
+    curves=CurveSet(*np.array(rows,dtype=np.float64).T)
+    counts=[len(q) for q in queries]
+    owner=np.repeat(np.arange(len(rows)),counts)
+    elevations=curves.elevations_for(owner,np.fromiter((s for q in queries for s in q),dtype=np.float64,count=len(owner)))
+    offsets=np.concatenate(([0],np.cumsum(counts)))
+    for j,i in enumerate(valid):
+        result=results[i]
+        result['pvc_station']=float(curves.pvc_station[j])
+        result['pvc_elevation']=float(curves.pvc_elevation[j])
+        result['pvt_station']=float(curves.pvt_station[j])
+        result['pvt_elevation']=float(curves.pvt_elevation[j])
+        result['curve_type']=VerticalCurveType(int(curves.curve_type[j])).name
+        result['high_low_station']=_number(curves.high_low_station[j])
+        result['high_low_elevation']=_number(curves.high_low_elevation[j])
+        if counts[j]:
+            result['stations']=queries[j]
+            result['elevations']=[_number(v) for v in elevations[offsets[j]:offsets[j+1]]]
+    return results
+
+
+def _chunks(items:Iterable, size:int) ->Iterator[list]:
+    items=iter(items)
+    while True:
+        chunk=list(islice(items,size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered_map(func, chunks:Iterable, workers:int) ->Iterator:
+    'Apply func to each chunk, optionally across a process pool, yielding results in input order'
+    if workers<=1:
+        yield from map(func,chunks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending=deque()
+        for chunk in chunks:
+            pending.append(pool.submit(func,chunk))
+            # Keep a bounded number of chunks in flight so memory does not grow with the input
+            if len(pending)>=2*workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def format_results(results:List[dict], fmt:str) ->str:
+    'Format solved records as CSV rows (without header) or NDJSON lines'
+    if fmt=='ndjson':
+        return ''.join(json.dumps(r)+'\n' for r in results)
+    buffer=io.StringIO()
+    writer=csv.DictWriter(buffer,fieldnames=OUTPUT_FIELDS,extrasaction='ignore')
+    for result in results:
+        row={k:('' if v is None else v) for k,v in result.items()}
+        for name in ('stations','elevations'):
+            if name in result:
+                row[name]=';'.join('' if v is None else repr(v) for v in result[name])
+        writer.writerow(row)
+    return buffer.getvalue()
+
+
+def _solve_lines(job) ->tuple:
+    'Parse, solve and format one chunk of raw input lines (runs in the worker processes)'
+    lines,in_format,header,out_format=job
+    if in_format=='csv':
+        records=csv.DictReader(lines,fieldnames=header)
+    else:
+        records=(_parse_json(line) for line in lines if line.strip())
+    results=solve_chunk(list(records))
+    return format_results(results,out_format),sum('error' in r for r in results)
+
+
+def _detect_format(path:Optional[str], default:str) ->str:
+    'Guess the file format from its extension'
+    if path and path.lower().endswith(('.ndjson','.jsonl','.json')):
+        return 'ndjson'
+    if path and path.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def main(argv=None) ->int:
+    parser=argparse.ArgumentParser(description="Compute vertical curve components from CSV or NDJSON curve definitions")
+    parser.add_argument('input',nargs='?',help="input file (default: stdin)")
+    parser.add_argument('-o','--output',help="output file (default: stdout)")
+    parser.add_argument('--format',choices=('csv','ndjson'),help="input format (default: from the file extension, csv for stdin)")
+    parser.add_argument('--output-format',choices=('csv','ndjson'),help="output format (default: same as the input)")
+    parser.add_argument('--workers',type=int,default=0,help="number of worker processes (default: run in this process)")
+    parser.add_argument('--chunk-size',type=int,default=10000,help="curves per chunk")
+    args=parser.parse_args(argv)
+    if args.chunk_size<=0:
+        parser.error("--chunk-size must be positive")
+
+    in_format=args.format or _detect_format(args.input,'csv')
+    out_format=args.output_format or _detect_format(args.output,in_format)
+    source=open(args.input,newline='') if args.input else sys.stdin
+    target=open(args.output,'w',newline='') if args.output else sys.stdout
+    try:
+        # Workers receive raw lines so parsing and formatting run in parallel too;
+        # CSV input must therefore keep each record on a single line.
+        header=next(csv.reader([source.readline()]),[]) if in_format=='csv' else None
+        if out_format=='csv':
+            csv.writer(target).writerow(OUTPUT_FIELDS)
+        jobs=((lines,in_format,header,out_format) for lines in _chunks(source,args.chunk_size))
+        failed=0
+        for text,errors in _ordered_map(_solve_lines,jobs,args.workers):
+            target.write(text)
+            failed+=errors
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            target.close()
+    if failed:
+        print(f"{failed} curve(s) could not be computed",file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import argparse
+import csv
+import mmap
+import struct
+import sys
+from typing import Dict, Optional
+import numpy as np
+from curveset import CurveSet
+from vertical_profile import VerticalProfile
+
+# Versioned binary container for curve sets and profiles (.pvcf).
+#
+# Layout (all little-endian):
+#   header   magic b'PVCF', version u16, kind u16, column count u32, row count u64, padded to 32 bytes
+#   columns  one 48 byte entry per column: name (24 bytes, NUL padded), dtype (8 bytes, e.g. '<f8'),
+#            byte offset u64, byte length u64
+#   data     each column as a fixed-width array starting on a 64 byte boundary
+#
+# Readers map the file and return NumPy views straight into the mapping, so opening
+# a file costs the same whatever its size and pages are only read when touched.
+# Unknown columns are ignored, which lets later versions add fields.
+
+MAGIC=b'PVCF'
+VERSION=1
+KINDS={'curves':1,'profile':2}
+ALIGNMENT=64
+
+_HEADER=struct.Struct('<4sHHIQ12x')
+_COLUMN=struct.Struct('<24s8sQQ')
+
+CURVE_COLUMNS=CurveSet.INPUTS
+DERIVED_COLUMNS=CurveSet.DERIVED+('curve_type',)
+PROFILE_COLUMNS=('pvi_station','pvi_elevation','length')
+
+
+def _aligned(offset:int) ->int:
+    return -(-offset//ALIGNMENT)*ALIGNMENT
+
+
+def write_columns(path:str, kind:str, columns:Dict[str,np.ndarray]):
+    'Write equal length one-dimensional columns to a file'
+    if kind not in KINDS:
+        raise ValueError(f"Unknown file kind {kind!r}")
+    arrays={}
+    for name,column in columns.items():
+        column=np.asarray(column)
+        arrays[name]=np.ascontiguousarray(column,dtype=column.dtype.newbyteorder('<'))
+    rows={len(a) for a in arrays.values()}
+    if len(rows)>1 or any(a.ndim!=1 for a in arrays.values()):
+        raise ValueError("Columns must be one-dimensional arrays of the same length")
+    table=[]
+    offset=_aligned(_HEADER.size+_COLUMN.size*len(arrays))
+    for name,array in arrays.items():
+        if len(name.encode('ascii'))>24:
+            raise ValueError(f"Column name {name!r} is longer than 24 characters")
+        table.append(_COLUMN.pack(name.encode('ascii'),array.dtype.str.encode('ascii'),offset,array.nbytes))
+        offset=_aligned(offset+array.nbytes)
+    with open(path,'wb') as f:
+        f.write(_HEADER.pack(MAGIC,VERSION,KINDS[kind],len(arrays),rows.pop() if rows else 0))
+        f.write(b''.join(table))
+        for array in arrays.values():
+            f.write(b'\0'*(_aligned(f.tell())-f.tell()))
+            f.write(memoryview(array).cast('B'))
+
+
+def read_columns(path:str, writable:bool=False) ->tuple:
+    'Map a file and get (kind, {name: array}) with the arrays viewing the mapping'
+    with open(path,'rb') as f:
+        # Copy-on-write keeps edits in memory without touching the file
+        buffer=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+    if len(buffer)<_HEADER.size:
+        raise ValueError(f"{path} is too short to be a curve file")
+    magic,version,kind,count,rows=_HEADER.unpack_from(buffer,0)
+    if magic!=MAGIC:
+        raise ValueError(f"{path} is not a curve file")
+    if version>VERSION:
+        raise ValueError(f"{path} uses format version {version}, this reader supports up to {VERSION}")
+    kinds={v:k for k,v in KINDS.items()}
+    if kind not in kinds:
+        raise ValueError(f"{path} has an unknown kind {kind}")
+    if _HEADER.size+count*_COLUMN.size>len(buffer):
+        raise ValueError(f"{path} has a corrupt column table")
+    columns={}
+    for i in range(count):
+        name,dtype,offset,nbytes=_COLUMN.unpack_from(buffer,_HEADER.size+i*_COLUMN.size)
+        dtype=np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+        if dtype.hasobject or nbytes!=rows*dtype.itemsize or offset+nbytes>len(buffer):
+            raise ValueError(f"{path} has a corrupt column table")
+        columns[name.rstrip(b'\0').decode('ascii')]=np.frombuffer(buffer,dtype=dtype,count=rows,offset=offset)
+    return kinds[kind],columns
+
+
+def _expect(path:str, kind:str, expected:str, columns:dict, names:tuple):
+    if kind!=expected:
+        raise ValueError(f"{path} holds {kind} data, not {expected} data")
+    missing=[name for name in names if name not in columns]
+    if missing:
+        raise ValueError(f"{path} is missing the columns {', '.join(missing)}")
+
+
+def save_curve_set(path:str, curves:CurveSet, derived:bool=True):
+    'Write a CurveSet, with its derived PVC/PVT/high-low columns unless derived is False'
+    names=CURVE_COLUMNS+(DERIVED_COLUMNS if derived else ())
+    write_columns(path,'curves',{name:getattr(curves,name) for name in names})
+
+
+def load_curve_set(path:str, writable:bool=False) ->CurveSet:
+    'Open a CurveSet backed by the file mapping (derived columns are computed only if the file lacks them)'
+    # The columns are read-only views unless writable is True, which maps the file
+    # copy-on-write so CurveView setters can edit curves without changing the file
+    kind,columns=read_columns(path,writable)
+    _expect(path,kind,'curves',columns,CURVE_COLUMNS)
+    return CurveSet.from_columns(columns)
+
+
+def save_profile(path:str, profile:VerticalProfile):
+    'Write the PVIs and curve lengths of a VerticalProfile'
+    pvis=profile.PVIs
+    write_columns(path,'profile',{'pvi_station':np.array([p.station for p in pvis],dtype=float),
+                                  'pvi_elevation':np.array([p.elevation for p in pvis],dtype=float),'length':profile.lengths})
+
+
+def load_profile(path:str) ->VerticalProfile:
+    'Read a VerticalProfile'
+    kind,columns=read_columns(path)
+    _expect(path,kind,'profile',columns,PROFILE_COLUMNS)
+    return VerticalProfile.from_arrays(columns['pvi_station'],columns['pvi_elevation'],columns['length'])
+
+
+# CSV conversion
+
+def to_csv(path:str, stream, chunk_size:int=65536):
+    'Write the columns of a curve file as CSV, one row per curve or PVI'
+    _,columns=read_columns(path)
+    names=list(columns)
+    writer=csv.writer(stream,lineterminator='\n')
+    writer.writerow(names)
+    rows=len(columns[names[0]]) if names else 0
+    for start in range(0,rows,chunk_size):
+        writer.writerows(zip(*[columns[name][start:start+chunk_size].tolist() for name in names]))
+
+
+def from_csv(stream, path:str, kind:Optional[str]=None, derived:bool=True) ->str:
+    'Convert CSV with curve (pvi_station, pvi_elevation, g1, g2, length) or profile columns to a curve file'
+    reader=csv.reader(stream)
+    header=[name.strip() for name in next(reader,[])]
+    if kind is None:
+        kind='curves' if 'g1' in header else 'profile'
+    names=CURVE_COLUMNS if kind=='curves' else PROFILE_COLUMNS
+    missing=[name for name in names if name not in header]
+    if missing:
+        raise ValueError(f"CSV input is missing the columns {', '.join(missing)}")
+    index=[header.index(name) for name in names]
+    values=[[] for _ in names]
+    for line,row in enumerate(reader,2):
+        if not row:
+            continue
+        try:
+            for column,i in zip(values,index):
+                column.append(float(row[i]))
+        except (IndexError,ValueError) as e:
+            raise ValueError(f"CSV line {line}: {e}") from None
+    arrays=[np.array(column,dtype=float) for column in values]
+    if kind=='curves':
+        save_curve_set(path,CurveSet(*arrays),derived)
+    else:
+        save_profile(path,VerticalProfile.from_arrays(*arrays))
+    return kind
+
+
+def main(argv=None) ->int:
+    parser=argparse.ArgumentParser(description="Convert between CSV and binary curve files")
+    commands=parser.add_subparsers(dest='command',required=True)
+    command=commands.add_parser('from-csv',help="convert CSV to a curve file")
+    command.add_argument('input',help="CSV file, '-' for stdin")
+    command.add_argument('output')
+    command.add_argument('--kind',choices=sorted(KINDS),help="default: curves if there is a g1 column")
+    command.add_argument('--no-derived',action='store_true',help="do not store the derived curve columns")
+    command=commands.add_parser('to-csv',help="convert a curve file to CSV")
+    command.add_argument('input')
+    command.add_argument('-o','--output',help="CSV file (default stdout)")
+    command=commands.add_parser('info',help="describe the columns of a curve file")
+    command.add_argument('input')
+    args=parser.parse_args(argv)
+
+    try:
+        if args.command=='from-csv':
+            source=sys.stdin if args.input=='-' else open(args.input,newline='')
+            try:
+                from_csv(source,args.output,args.kind,not args.no_derived)
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+        elif args.command=='to-csv':
+            target=open(args.output,'w',newline='') if args.output else sys.stdout
+            try:
+                to_csv(args.input,target)
+            finally:
+                if target is not sys.stdout:
+                    target.close()
+        else:
+            kind,columns=read_columns(args.input)
+            rows=len(next(iter(columns.values()))) if columns else 0
+            print(f"{args.input}: {kind}, {rows} rows")
+            for name,column in columns.items():
+                print(f"  {name:24} {column.dtype.str}")
+    except (OSError,ValueError) as e:
+        print(f"error: {e}",file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+import numpy as np
+from curveset import CurveSet
+from parabolic import VerticalCurveType, VerticalParabolicCurve, VerticalPoint
+from vertical_profile import VerticalProfile
+
+# Long-running local evaluation service (HTTP/1.1 with JSON bodies) over TCP on
+# localhost or a Unix socket. Curves and profiles stay resident between requests.
+#
+#   POST /curves    {"pvi_station", "pvi_elevation", "g1", "g2", "length"}
+#                   or {"pvis": [[station, elevation], ...], "lengths": [...]}  -> {"id"}
+#   DELETE /curves/<id>
+#   POST /evaluate  {"id", "stations": [...]}                 -> {"elevations", "slopes"}
+#   POST /project   {"id", "stations": [...], "elevations": [...]} -> {"design", "offsets"}
+#   POST /solve     {"curves": [{"pvi_station", ...}, ...]}   -> {"curves": [...]}
+#   GET  /stats
+#
+# Concurrent /evaluate and /project requests for the same design that arrive within
+# the batching window are concatenated into one vectorized call.
+
+
+class HttpError(Exception):
+    def __init__(self, status:int, message:str):
+        super().__init__(message)
+        self.status=status
+
+
+_REASONS={200:'OK',201:'Created',400:'Bad Request',404:'Not Found',405:'Method Not Allowed',500:'Internal Server Error'}
+
+
+def _floats(values) ->list:
+    'Convert an array to a JSON-ready list with NaN as null'
+    return [None if v!=v else v for v in np.asarray(values,dtype=float).tolist()]
+
+
+class Batcher:
+    # Coalesces array requests with the same key that arrive within `window` seconds
+
+    def __init__(self, window:float):
+        self.window=window
+        self._pending={}
+        self.batches=0
+        self.requests=0
+
+    async def submit(self, key, func, *arrays) ->tuple:
+        'Queue the arrays for func(*arrays) and wait for this request\'s slice of the batched result'
+        loop=asyncio.get_running_loop()
+        future=loop.create_future()
+        entries=self._pending.get(key)
+        if entries is None:
+            entries=self._pending[key]=[]
+            loop.call_later(self.window,self._flush,key,func)
+        entries.append((arrays,future))
+        return await future
+
+    def _flush(self, key, func):
+        entries=self._pending.pop(key)
+        self.batches+=1
+        self.requests+=len(entries)
+        try:
+            columns=[np.concatenate([arrays[i] for arrays,_ in entries]) for i in range(len(entries[0][0]))]
+            results=func(*columns)
+        except Exception as e:
+            for _,future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        bounds=np.cumsum([len(arrays[0]) for arrays,_ in entries])[:-1]
+        parts=[np.split(result,bounds) for result in results]
+        for i,(_,future) in enumerate(entries):
+            if not future.done():
+                future.set_result(tuple(part[i] for part in parts))
+
+
+class Stats:
+    # Request counters and latency samples per endpoint
+
+    def __init__(self, samples:int=1000):
+        self.started=time.monotonic()
+        self._samples=samples
+        self._endpoints={}
+
+    def record(self, endpoint:str, seconds:float, failed:bool):
+        entry=self._endpoints.get(endpoint)
+        if entry is None:
+            entry=self._endpoints[endpoint]={'requests':0,'errors':0,'total_seconds':0.0,'max_seconds':0.0,'recent':deque(maxlen=self._samples)}
+        entry['requests']+=1
+        entry['errors']+=failed
+        entry['total_seconds']+=seconds
+        entry['max_seconds']=max(entry['max_seconds'],seconds)
+        entry['recent'].append(seconds)
+
+    def snapshot(self) ->dict:
+        uptime=time.monotonic()-self.started
+        endpoints={}
+        for name,entry in self._endpoints.items():
+            recent=np.array(entry['recent'])
+            endpoints[name]={'requests':entry['requests'],'errors':entry['errors'],
+                             'mean_ms':1000*entry['total_seconds']/entry['requests'],'max_ms':1000*entry['max_seconds'],
+                             'p50_ms':float(1000*np.percentile(recent,50)),'p95_ms':float(1000*np.percentile(recent,95)),
+                             'requests_per_sec':entry['requests']/uptime if uptime>0 else 0.0}
+        return {'uptime_seconds':uptime,'endpoints':endpoints}
+
+
+class CurveServer:
+    def __init__(self, window:float=0.002):
+        self.designs:Dict[int,object]={}
+        self._next_id=1
+        self.batcher=Batcher(window)
+        self.stats=Stats()
+
+    # Request handling
+
+    def _design(self, body:dict):
+        if 'id' not in body:
+            raise HttpError(400,"id is required")
+        design=self.designs.get(int(body['id']))
+        if design is None:
+            raise HttpError(404,f"unknown design id {body['id']}")
+        return design
+
+    def _create(self, body:dict) ->dict:
+        if 'pvis' in body:
+            design=VerticalProfile([VerticalPoint(float(s),float(e)) for s,e in body['pvis']],body.get('lengths'))
+        else:
+            design=VerticalParabolicCurve().configure(PVI=VerticalPoint(float(body['pvi_station']),float(body['pvi_elevation'])),
+                                                      g1=float(body['g1']),g2=float(body['g2']),Length=float(body['length']))
+            if not design.is_initialized:
+                raise ValueError("length must be positive")
+        design_id=self._next_id
+        self._next_id+=1
+        self.designs[design_id]=design
+        return {'id':design_id}
+
+    async def _evaluate(self, body:dict) ->dict:
+        design=self._design(body)
+        stations=np.asarray(body['stations'],dtype=float).ravel()
+        elevations,slopes=await self.batcher.submit(('evaluate',id(design)),
+                                                    lambda s:(design.elevations_at(s),design.slopes_at(s)),stations)
+        return {'elevations':_floats(elevations),'slopes':_floats(slopes)}
+
+    async def _project(self, body:dict) ->dict:
+        design=self._design(body)
+        stations=np.asarray(body['stations'],dtype=float).ravel()
+        elevations=np.asarray(body['elevations'],dtype=float).ravel()
+        if len(stations)!=len(elevations):
+            raise ValueError("stations and elevations must have the same length")
+        design_elevations,offsets=await self.batcher.submit(('project',id(design)),design.project_points,stations,elevations)
+        return {'design':_floats(design_elevations),'offsets':_floats(offsets)}
+
+    def _solve(self, body:dict) ->dict:
+        curves=body['curves'] if 'curves' in body else [body]
+        rows=np.array([[float(c[k]) for k in CurveSet.INPUTS] for c in curves],dtype=float).reshape(-1,5)
+        bad=np.nonzero(~(rows[:,4]>0))[0]
+        if len(bad):
+            raise ValueError(f"length must be positive (curve {int(bad[0])})")
+        solved=CurveSet(*rows.T)
+        columns={name:_floats(getattr(solved,name)) for name in ('pvc_station','pvc_elevation','pvt_station','pvt_elevation',
+                                                                'high_low_station','high_low_elevation')}
+        results=[]
+        for i in range(len(solved)):
+            result={name:values[i] for name,values in columns.items()}
+            result['curve_type']=VerticalCurveType(int(solved.curve_type[i])).name
+            results.append(result)
+        return {'curves':results}
+
+    async def dispatch(self, method:str, path:str, body:Optional[dict]):
+        'Route one request and return (status, response body)'
+        if path=='/stats' and method=='GET':
+            snapshot=self.stats.snapshot()
+            snapshot['designs']=len(self.designs)
+            snapshot['batching']={'batches':self.batcher.batches,'requests':self.batcher.requests,
+                                  'mean_batch_size':self.batcher.requests/self.batcher.batches if self.batcher.batches else 0.0}
+            return 200,snapshot
+        if path.startswith('/curves/') and method=='DELETE':
+            try:
+                del self.designs[int(path.rsplit('/',1)[1])]
+            except (KeyError,ValueError):
+                raise HttpError(404,"unknown design id")
+            return 200,{}
+        routes={'/curves':self._create,'/evaluate':self._evaluate,'/project':self._project,'/solve':self._solve}
+        handler=routes.get(path)
+        if handler is None:
+            raise HttpError(404,f"unknown endpoint {path}")
+        if method!='POST':
+            raise HttpError(405,f"{path} expects POST")
+        if not isinstance(body,dict):
+            raise HttpError(400,"request body must be a JSON object")
+        result=handler(body)
+        if asyncio.iscoroutine(result):
+            result=await result
+        return (201 if path=='/curves' else 200),result
+
+    # HTTP transport
+
+    async def handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        try:
+            while True:
+                request_line=await reader.readline()
+                if not request_line.strip():
+                    break
+                method,path,_=request_line.decode('latin-1').split(' ',2)
+                headers={}
+                while True:
+                    line=await reader.readline()
+                    if line in (b'\r\n',b'\n',b''):
+                        break
+                    name,_,value=line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()]=value.strip()
+                length=int(headers.get('content-length','0'))
+                raw=await reader.readexactly(length) if length else b''
+                keep_alive=headers.get('connection','').lower()!='close'
+                status,payload=await self._respond(method,path.split('?',1)[0],raw)
+                data=json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {_REASONS.get(status,'')}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()+data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError,ConnectionError,ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method:str, path:str, raw:bytes) ->tuple:
+        start=time.perf_counter()
+        try:
+            body=json.loads(raw) if raw else None
+            status,payload=await self.dispatch(method,path,body)
+        except HttpError as e:
+            status,payload=e.status,{'error':str(e)}
+        except (KeyError,TypeError,ValueError) as e:
+            status,payload=400,{'error':f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            status,payload=500,{'error':f"{type(e).__name__}: {e}"}
+        self.stats.record(f"{method} {path if not path.startswith('/curves/') else '/curves/<id>'}",time.perf_counter()-start,status>=400)
+        return status,payload
+
+
+async def serve(host:str='127.0.0.1', port:int=8765, unix:Optional[str]=None, window:float=0.002):
+    'Run the evaluation server until cancelled'
+    server=CurveServer(window)
+    if unix:
+        listener=await asyncio.start_unix_server(server.handle_connection,path=unix)
+    else:
+        listener=await asyncio.start_server(server.handle_connection,host,port)
+    where=unix or f"http://{host}:{port}"
+    print(f"Serving vertical curves on {where}",file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None) ->int:
+    parser=argparse.ArgumentParser(description="Serve vertical curve evaluation over local HTTP")
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=8765)
+    parser.add_argument('--unix',help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--window',type=float,default=2.0,help="batching window in milliseconds")
+    args=parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host,args.port,args.unix,args.window/1000))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+from typing import Iterable, Optional
+import logging
+import numpy as np
+from parabolic import VerticalParabolicCurve, VerticalPoint, VerticalCurveType, elevation_crossings, slope_crossings
+
+
+class CurveSet:
+    # Stores many vertical curves as parallel typed arrays (one contiguous column per field)
+    #
+    # Inputs: pvi_station, pvi_elevation, g1, g2, length
+    # Derived: pvc_station, pvc_elevation, pvt_station, pvt_elevation, curve_type,
+    #          high_low_station, high_low_elevation (NaN where the curve has no high/low point)
+    # Curves with a non-positive length are not initialized and carry NaN derived values.
+
+    INPUTS=('pvi_station','pvi_elevation','g1','g2','length')
+    DERIVED=('pvc_station','pvc_elevation','pvt_station','pvt_elevation','high_low_station','high_low_elevation')
+
+    def __init__(self, pvi_station, pvi_elevation, g1, g2, length):
+        "Create a curve set from equally sized arrays of curve inputs"
+        columns=[np.ascontiguousarray(c,dtype=np.float64) for c in (pvi_station,pvi_elevation,g1,g2,length)]
+        count=columns[0].shape
+        if len(count)!=1 or any(c.shape!=count for c in columns):
+            raise ValueError("Curve inputs must be one-dimensional arrays of the same length")
+        self.pvi_station,self.pvi_elevation,self.g1,self.g2,self.length=columns
+        for name in self.DERIVED:
+            setattr(self,name,np.empty(count,dtype=np.float64))
+        self.curve_type=np.empty(count,dtype=np.int8)
+        self.derive()
+
+    @classmethod
+    def from_columns(cls, columns:dict) ->'CurveSet':
+        'Wrap existing column arrays (e.g. memory-mapped) without copying, deriving only missing fields'
+        curves=cls.__new__(cls)
+        inputs=[np.ascontiguousarray(columns[name],dtype=np.float64) for name in cls.INPUTS]
+        if any(c.shape!=inputs[0].shape or c.ndim!=1 for c in inputs):
+            raise ValueError("Curve inputs must be one-dimensional arrays of the same length")
+        for name,column in zip(cls.INPUTS,inputs):
+            setattr(curves,name,column)
+        if all(name in columns for name in cls.DERIVED+('curve_type',)):
+            for name in cls.DERIVED:
+                setattr(curves,name,np.ascontiguousarray(columns[name],dtype=np.float64))
+            curves.curve_type=np.ascontiguousarray(columns['curve_type'],dtype=np.int8)
+        else:
+            for name in cls.DERIVED:
+                setattr(curves,name,np.empty(inputs[0].shape,dtype=np.float64))
+            curves.curve_type=np.empty(inputs[0].shape,dtype=np.int8)
+            curves.derive()
+        return curves
+
+    @classmethod
+    def from_curves(cls, curves:Iterable[VerticalParabolicCurve]) ->'CurveSet':
+        'Pack existing curve objects into a curve set'
+        rows=[(c.PVI.station,c.PVI.elevation,c.g1,c.g2,c.Length) for c in curves]
+        columns=np.array(rows,dtype=np.float64).reshape(-1,5)
+        return cls(*columns.T)
+
+    def derive(self, where=slice(None)):
+        'Recalculate the derived fields of all curves, or of the curves selected by where'
+        s=self.pvi_station[where]
+        e=self.pvi_elevation[where]
+        g1=self.g1[where]
+        g2=self.g2[where]
+        L=np.where(self.length[where]>0,self.length[where],np.nan)
+        half=L/2
+        a=g2-g1
+        pvc_station=s-half
+        pvc_elevation=e-g1*half
+        self.pvc_station[where]=pvc_station
+        self.pvc_elevation[where]=pvc_elevation
+        self.pvt_station[where]=s+half
+        self.pvt_elevation[where]=e+g2*half
+        self.curve_type[where]=np.where(a>0,VerticalCurveType.Sag.value,VerticalCurveType.Crest.value)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            X=-(g1/a)*L
+            X=np.where((X>=0)&(X<=L),X,np.nan)
+            self.high_low_station[where]=pvc_station+X
+            self.high_low_elevation[where]=a/(2*L)*X**2+g1*X+pvc_elevation
+
+    @property
+    def initialized(self) ->np.ndarray:
+        'Get a boolean mask of the curves that can be evaluated'
+        return self.length>0
+
+    def __len__(self) ->int:
+        return len(self.pvi_station)
+
+    def __getitem__(self, index:int) ->'CurveView':
+        if index<0:
+            index+=len(self)
+        if not 0<=index<len(self):
+            raise IndexError("Curve index out of range")
+        return CurveView(self,index)
+
+    def __iter__(self):
+        return (CurveView(self,i) for i in range(len(self)))
+
+    def elevations_at(self, stations) ->np.ndarray:
+        'Calculate the elevation of each curve at its station (broadcast over trailing axes), NaN outside'
+        return self._evaluate(stations,False)
+
+    def slopes_at(self, stations) ->np.ndarray:
+        'Calculate the slope of each curve at its station (broadcast over trailing axes), NaN outside'
+        return self._evaluate(stations,True)
+
+    def elevations_for(self, index, stations) ->np.ndarray:
+        'Calculate elevations for pairs of curve index and station, NaN outside the curve'
+        index=np.asarray(index,dtype=np.intp)
+        stations=np.asarray(stations,dtype=np.float64)
+        L=np.where(self.length[index]>0,self.length[index],np.nan)
+        g1=self.g1[index]
+        x=stations-self.pvc_station[index]
+        values=((self.g2[index]-g1)/(2*L)*x+g1)*x+self.pvc_elevation[index]
+        return np.where((stations>=self.pvc_station[index])&(stations<=self.pvt_station[index]),values,np.nan)
+
+    def _coefficients(self, ndim:int) ->tuple:
+        'Get (PVC station, PVC elevation, g1, half rate, PVT station) columns shaped to broadcast over ndim-dimensional targets'
+        index=(slice(None),)+(np.newaxis,)*(ndim-1)
+        L=np.where(self.length>0,self.length,np.nan)
+        return (self.pvc_station[index],self.pvc_elevation[index],self.g1[index],
+                ((self.g2-self.g1)/(2*L))[index],self.pvt_station[index])
+
+    def stations_at_elevation(self, elevations) ->np.ndarray:
+        'Find where each curve reaches its target elevation(s) (broadcast over trailing axes); (..., 2) stations, NaN padded'
+        elevations=np.asarray(elevations,dtype=np.float64)
+        if elevations.ndim==0:
+            elevations=np.full(len(self),float(elevations))
+        return elevation_crossings(*self._coefficients(elevations.ndim),elevations)
+
+    def stations_at_slope(self, slopes) ->np.ndarray:
+        'Find where each curve reaches its target slope(s) (broadcast over trailing axes), NaN where it does not'
+        slopes=np.asarray(slopes,dtype=np.float64)
+        if slopes.ndim==0:
+            slopes=np.full(len(self),float(slopes))
+        return slope_crossings(*self._coefficients(slopes.ndim),slopes)
+
+    def _evaluate(self, stations, slope:bool) ->np.ndarray:
+        'Evaluate the elevation or slope polynomial of every curve'
+        stations=np.asarray(stations,dtype=np.float64)
+        extra=(np.newaxis,)*(stations.ndim-1)
+        L=np.where(self.length>0,self.length,np.nan)[(slice(None),)+extra]
+        g1=self.g1[(slice(None),)+extra]
+        a=(self.g2[(slice(None),)+extra]-g1)/(2*L)
+        pvc_station=self.pvc_station[(slice(None),)+extra]
+        x=stations-pvc_station
+        if slope:
+            values=2*a*x+g1
+        else:
+            values=(a*x+g1)*x+self.pvc_elevation[(slice(None),)+extra]
+        return np.where((stations>=pvc_station)&(stations<=self.pvt_station[(slice(None),)+extra]),values,np.nan)
+
+
+class CurveView:
+    # Lightweight proxy to one curve of a CurveSet with the VerticalParabolicCurve API
+    __slots__=('_set','_index')
+
+    def __init__(self, curve_set:CurveSet, index:int):
+        self._set=curve_set
+        self._index=index
+
+    def _point(self, station_field:str, elevation_field:str) ->Optional[VerticalPoint]:
+        station=float(getattr(self._set,station_field)[self._index])
+        if station!=station:
+            return None
+        return VerticalPoint(station,float(getattr(self._set,elevation_field)[self._index]))
+
+    def _check_writable(self):
+        if not all(getattr(self._set,name).flags.writeable for name in CurveSet.INPUTS):
+            raise ValueError("The curve set is read-only; open it with load_curve_set(path, writable=True) to edit curves")
+
+    def _set_input(self, name:str, value:float):
+        self._check_writable()
+        getattr(self._set,name)[self._index]=value
+        self._set.derive(slice(self._index,self._index+1))
+
+    @property
+    def PVC(self) ->VerticalPoint:
+        "Get the point of vertical curvature (start of the curve)"
+        return self._point('pvc_station','pvc_elevation')
+
+    @property
+    def PVT(self) ->VerticalPoint:
+        "Get the point of vertical tangency"
+        return self._point('pvt_station','pvt_elevation')
+
+    @property
+    def PVI(self) ->VerticalPoint:
+        "Get the point of vertical intersection"
+        return self._point('pvi_station','pvi_elevation')
+
+    @PVI.setter
+    def PVI(self, value:VerticalPoint):
+        "Set the PVI and update the curve"
+        if value is None:
+            raise ValueError("PVI cannot be None")
+        self.configure(PVI=value)
+
+    @property
+    def g1(self) ->float:
+        "Get the incoming grade"
+        return float(self._set.g1[self._index])
+
+    @g1.setter
+    def g1(self, value:float):
+        "Set the incoming grade and update the curve"
+        self._set_input('g1',value)
+
+    @property
+    def g2(self) ->float:
+        "Get the outgoing grade"
+        return float(self._set.g2[self._index])
+
+    @g2.setter
+    def g2(self, value:float):
+        "Set the outgoing grade and update the curve"
+        self._set_input('g2',value)
+
+    @property
+    def Length(self) ->float:
+        "Get the horizontal length of the curve"
+        return float(self._set.length[self._index])
+
+    @Length.setter
+    def Length(self, value:float):
+        "Set the horizontal length of the curve and update the curve"
+        self._set_input('length',value)
+
+    @property
+    def Curve_type(self) ->VerticalCurveType:
+        "Get the curve type (crest or sag)"
+        return VerticalCurveType(int(self._set.curve_type[self._index]))
+
+    @property
+    def High_low_point(self) ->Optional[VerticalPoint]:
+        'Get the high or low point of the curve'
+        return self._point('high_low_station','high_low_elevation')
+
+    @property
+    def is_initialized(self) ->bool:
+        'Check whether the curve has enough input to be evaluated'
+        return bool(self._set.length[self._index]>0)
+
+    def configure(self, PVI:Optional[VerticalPoint]=None, g1:Optional[float]=None, g2:Optional[float]=None, Length:Optional[float]=None) ->'CurveView':
+        'Set several curve inputs at once with a single recomputation'
+        self._check_writable()
+        i=self._index
+        if PVI is not None:
+            self._set.pvi_station[i]=PVI.station
+            self._set.pvi_elevation[i]=PVI.elevation
+        if g1 is not None:
+            self._set.g1[i]=g1
+        if g2 is not None:
+            self._set.g2[i]=g2
+        if Length is not None:
+            self._set.length[i]=Length
+        self._set.derive(slice(i,i+1))
+        return self
+
+    def _offset(self, station:float) ->Optional[float]:
+        'Get the distance from PVC to a station, None outside the curve'
+        if not self.is_initialized:
+            raise ValueError("Curve not initialized")
+        pvc_station=float(self._set.pvc_station[self._index])
+        if station<pvc_station or station>self._set.pvt_station[self._index]:
+            logging.warning("Station must be within the curve length")
+            return None
+        return station-pvc_station
+
+    def elevation_at(self, station:float) ->float:
+        'Calculate the elevation at a given station along the curve'
+        x=self._offset(station)
+        if x is None:
+            return None
+        i=self._index
+        g1=float(self._set.g1[i])
+        return (float(self._set.g2[i])-g1)/(2*float(self._set.length[i]))*x**2+g1*x+float(self._set.pvc_elevation[i])
+
+    def slope_at(self, station:float) ->float:
+        'Calculate the slope at a given station along the curve'
+        x=self._offset(station)
+        if x is None:
+            return None
+        i=self._index
+        g1=float(self._set.g1[i])
+        return (float(self._set.g2[i])-g1)/float(self._set.length[i])*x+g1
+
+    def distance_to_High_low_point(self) ->float:
+        'Calculate the horizontal distance from PVC to high/low point (if it exists)'
+        if not self.is_initialized:
+            raise ValueError("Curve not initialized")
+        high_low=self.High_low_point
+        if high_low is None:
+            return None
+        return high_low.station-float(self._set.pvc_station[self._index])
+
+    def projectpoint_at(self, point:VerticalPoint) ->VerticalPoint:
+        'Project a point onto the curve by finding the closest point'
+        return self.to_curve().projectpoint_at(point)
+
+    def create_offset_curve(self, offset:float) ->VerticalParabolicCurve:
+        """Create a parallel vertical curve offset vertically."""
+        return self.to_curve().create_offset_curve(offset)
+
+    def to_curve(self) ->VerticalParabolicCurve:
+        'Copy this curve into a standalone VerticalParabolicCurve'
+        if not self.is_initialized:
+            raise ValueError("Curve not initialized")
+        return VerticalParabolicCurve().configure(PVI=self.PVI,g1=self.g1,g2=self.g2,Length=self.Length)
@@ -0,0 +1,90 @@
+from typing import Optional
+import numpy as np
+from parabolic import VerticalCurveType
+
+# Minimum vertical curve lengths from sight distance criteria (AASHTO, metric units:
+# speeds in km/h, distances and heights in m, grades as decimals).
+#
+# All functions broadcast over NumPy arrays, so a whole profile or curve set is
+# sized in one call. Crest curves use the driver eye / object heights, sag curves
+# the headlight height and upward beam divergence. Both the S<L and S>L branches
+# are evaluated and the one consistent with the resulting length is kept.
+
+EYE_HEIGHT=1.08             #Driver eye height
+STOPPING_OBJECT_HEIGHT=0.60 #Object height for stopping sight distance
+PASSING_OBJECT_HEIGHT=1.08  #Object height (oncoming vehicle) for passing sight distance
+HEADLIGHT_HEIGHT=0.60       #Headlight height for sag curves
+BEAM_ANGLE=1.0              #Upward divergence of the headlight beam in degrees
+
+# Design passing sight distance by design speed
+_PASSING_SPEEDS=(30,40,50,60,70,80,90,100,110,120,130)
+_PASSING_DISTANCES=(120,140,160,180,210,245,280,320,355,395,440)
+
+
+def stopping_sight_distance(speed, reaction_time:float=2.5, deceleration:float=3.4, grade=0.0) ->np.ndarray:
+    'Calculate the stopping sight distance for a design speed, optionally on a grade'
+    speed=np.asarray(speed,dtype=float)
+    return 0.278*speed*reaction_time+speed**2/(254*(deceleration/9.81+np.asarray(grade,dtype=float)))
+
+
+def passing_sight_distance(speed) ->np.ndarray:
+    'Look up the design passing sight distance for a design speed (interpolated)'
+    return np.interp(np.asarray(speed,dtype=float),_PASSING_SPEEDS,_PASSING_DISTANCES)
+
+
+def curve_types(g1, g2) ->np.ndarray:
+    'Classify curves as VerticalCurveType values (Sag when the grade increases, otherwise Crest)'
+    return np.where(np.asarray(g2,dtype=float)-np.asarray(g1,dtype=float)>0,VerticalCurveType.Sag.value,VerticalCurveType.Crest.value)
+
+
+def minimum_length(g1, g2, sight_distance, eye_height:float=EYE_HEIGHT, object_height:float=STOPPING_OBJECT_HEIGHT,
+                   headlight_height:float=HEADLIGHT_HEIGHT, beam_angle:float=BEAM_ANGLE) ->np.ndarray:
+    'Calculate the minimum curve length that provides a sight distance over crest and sag curves'
+    g1=np.asarray(g1,dtype=float)
+    g2=np.asarray(g2,dtype=float)
+    S=np.asarray(sight_distance,dtype=float)
+    A=np.abs(g2-g1)*100     #Algebraic difference in grades in percent
+    sag=curve_types(g1,g2)==VerticalCurveType.Sag.value
+    crest_C=200*(np.sqrt(eye_height)+np.sqrt(object_height))**2
+    sag_C=200*(headlight_height+S*np.tan(np.radians(beam_angle)))
+    C=np.where(sag,sag_C,crest_C)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        long_curve=A*S**2/C     #S<L
+        short_curve=2*S-C/A     #S>L
+    length=np.where(long_curve>=S,long_curve,np.maximum(short_curve,0.0))
+    return np.where(A>0,length,0.0)
+
+
+def minimum_k(g1, g2, sight_distance, **heights) ->np.ndarray:
+    'Calculate the minimum rate of vertical curvature K (length per percent of grade change)'
+    A=np.abs(np.asarray(g2,dtype=float)-np.asarray(g1,dtype=float))*100
+    with np.errstate(divide='ignore',invalid='ignore'):
+        return np.where(A>0,minimum_length(g1,g2,sight_distance,**heights)/A,0.0)
+
+
+def _sight_distance(speed, sight_distance, passing:bool):
+    if sight_distance is not None:
+        return sight_distance
+    if speed is None:
+        raise ValueError("Either a design speed or a sight distance is required")
+    return passing_sight_distance(speed) if passing else stopping_sight_distance(speed)
+
+
+def required_lengths(g1, g2, speed=None, sight_distance=None, passing:bool=False, **heights) ->np.ndarray:
+    'Calculate the minimum curve lengths for a design speed or sight distance'
+    if passing:
+        heights.setdefault('object_height',PASSING_OBJECT_HEIGHT)
+    return minimum_length(g1,g2,_sight_distance(speed,sight_distance,passing),**heights)
+
+
+def check_curve_set(curves, speed=None, sight_distance:Optional[float]=None, passing:bool=False, **heights) ->tuple:
+    'Get the required length of every curve in a CurveSet and a mask of the curves that are too short'
+    required=required_lengths(curves.g1,curves.g2,speed,sight_distance,passing,**heights)
+    return required,curves.length<required
+
+
+def check_profile(profile, speed=None, sight_distance:Optional[float]=None, passing:bool=False, **heights) ->tuple:
+    'Get the required curve length at each interior PVI of a VerticalProfile and a mask of the curves that are too short'
+    grades=profile.grades
+    required=required_lengths(grades[:-1],grades[1:],speed,sight_distance,passing,**heights)
+    return required,profile.lengths[1:-1]<required
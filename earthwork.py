@@ -0,0 +1,83 @@
+from typing import NamedTuple
+import numpy as np
+from parabolic import quadratic_roots
+
+# Cut and fill between a design (VerticalParabolicCurve or VerticalProfile) and a
+# piecewise-linear ground profile, integrated exactly.
+#
+# The design pieces (z = e + g*u + a*u**2) and the ground vertices are merged into
+# one sorted set of breakpoints. Between two breakpoints design minus ground is a
+# single quadratic D(u) = c + b*u + a*u**2, so each interval is split at the roots of
+# D (at most two) and the parts where D>0 (fill) and D<0 (cut) are integrated with the
+# antiderivative c*u + b*u**2/2 + a*u**3/3. Everything is done on whole arrays.
+
+
+class Earthwork(NamedTuple):
+    "Cumulative earthwork quantities along a design"
+    stations:np.ndarray #Stations of the ordinates
+    cut:np.ndarray      #Cumulative cut (ground above design) from the first station
+    fill:np.ndarray     #Cumulative fill (design above ground), multiplied by the fill factor
+    mass:np.ndarray     #Mass-haul ordinate: cumulative cut minus cumulative fill
+
+
+def _antiderivative(u, c, b, a) ->np.ndarray:
+    return u*(c+u*(b/2+u*a/3))
+
+
+def earthwork(design, ground_stations, ground_elevations, stations=None, width:float=1.0,
+              fill_factor:float=1.0) ->Earthwork:
+    'Integrate cut and fill between a design and a ground profile over the stations both cover'
+    ground_stations=np.asarray(ground_stations,dtype=float)
+    ground_elevations=np.asarray(ground_elevations,dtype=float)
+    if ground_stations.ndim!=1 or ground_stations.shape!=ground_elevations.shape or len(ground_stations)<2:
+        raise ValueError("The ground needs matching one-dimensional station and elevation arrays with at least two points")
+    if np.any(np.diff(ground_stations)<=0):
+        raise ValueError("Ground stations must be strictly increasing")
+    if width<=0 or fill_factor<=0:
+        raise ValueError("The width and fill factor must be positive")
+    starts,ends,elevations,grades,rates=design.pieces()
+    low=max(starts[0],ground_stations[0])
+    high=min(ends[-1],ground_stations[-1])
+    if low>=high:
+        raise ValueError("The design and the ground do not overlap")
+    breaks=[ground_stations,starts,ends[-1:]]
+    if stations is not None:
+        stations=np.asarray(stations,dtype=float)
+        if np.any((stations<low)|(stations>high)):
+            raise ValueError("Output stations must lie where both the design and the ground are defined")
+        breaks.append(stations)
+    x=np.unique(np.concatenate(breaks))
+    x=x[(x>=low)&(x<=high)]
+    if x[0]!=low or x[-1]!=high:
+        x=np.unique(np.concatenate(([low],x,[high])))
+
+    # Design minus ground on every interval, expanded about its left end
+    left=x[:-1]
+    h=np.diff(x)
+    middle=left+h/2
+    k=np.clip(np.searchsorted(starts,middle,side='right')-1,0,len(starts)-1)
+    j=np.clip(np.searchsorted(ground_stations,middle,side='right')-1,0,len(ground_stations)-2)
+    ground_slope=np.diff(ground_elevations)[j]/np.diff(ground_stations)[j]
+    u=left-starts[k]
+    a=rates[k]
+    b=grades[k]+2*a*u-ground_slope
+    c=elevations[k]+(grades[k]+a*u)*u-(ground_elevations[j]+ground_slope*(left-ground_stations[j]))
+
+    # Split each interval at the roots of D and integrate the signed parts
+    r1,r2=quadratic_roots(a,b,c)
+    r1=np.where((r1>0)&(r1<h),r1,h)
+    r2=np.where((r2>0)&(r2<h),r2,h)
+    bounds=(np.zeros_like(h),np.minimum(r1,r2),np.maximum(r1,r2),h)
+    cut=np.zeros_like(h)
+    fill=np.zeros_like(h)
+    for p,q in zip(bounds[:-1],bounds[1:]):
+        area=_antiderivative(q,c,b,a)-_antiderivative(p,c,b,a)
+        fill+=np.maximum(area,0.0)
+        cut+=np.maximum(-area,0.0)
+
+    cut=np.concatenate(([0.0],np.cumsum(cut)))*width
+    fill=np.concatenate(([0.0],np.cumsum(fill)))*width*fill_factor
+    if stations is not None:
+        index=np.searchsorted(x,stations)
+        x,cut,fill=stations,cut[index],fill[index]
+    return Earthwork(x,cut,fill,cut-fill)
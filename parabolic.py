@@ -1,14 +1,35 @@
+from __future__ import annotations
 from enum import Enum
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional
-import logging
+from typing import NamedTuple, Optional
+import functools
+import importlib
+import time
+
+class _LazyModule:
+    # Stands in for a module until first use, so scalar-only users never import it.
+    # The first attribute access imports the module and rebinds the global name to it.
+
+    def __init__(self, name:str, namespace:dict, alias:str):
+        self._name=name
+        self._namespace=namespace
+        self._alias=alias
+
+    def __getattr__(self, attr:str):
+        module=importlib.import_module(self._name)
+        self._namespace[self._alias]=module
+        return getattr(module,attr)
+
+np=_LazyModule('numpy',globals(),'np')     #Only the batch APIs (arrays, pieces, crossings) need NumPy
+logging=_LazyModule('logging',globals(),'logging')  #Only needed for out-of-range warnings
 class VerticalCurveType(Enum):
     "Enum for determining whether the curve is sag or crest"
     Sag=0
     Crest=1
 
 
-@dataclass
+@dataclass(slots=True)
 # Purpose: Represents a point with a station (distance along the road) and elevation (height).
 # distance_to: Calculates the horizontal distance between two points (ignores elevation)
 class VerticalPoint:
@@ -20,7 +41,7 @@ class VerticalPoint:
         'Calculate the absolute horizontal distance to another station'
         return abs(self.station-other.station)
 
-@dataclass
+@dataclass(slots=True)
 class TVerticalCurve:
     #Data structure for vertical parabolic curve properties
     g1:float=0.0    #Incoming grade (as a decimal) e.g. 0.02 for 2%
@@ -33,21 +54,81 @@ class TVerticalCurve:
     High_low_point: Optional[VerticalPoint]=None     # HIgh or Low point
     is_initialized: bool=False
 
+class CurveSolution(NamedTuple):
+    "Derived geometry of a curve, stored as plain numbers so it can be shared between curves"
+    PVC_station:float
+    PVC_elevation:float
+    PVT_station:float
+    PVT_elevation:float
+    Curve_type:VerticalCurveType
+    High_low_station:Optional[float]    #None when the curve has no high or low point
+    High_low_elevation:Optional[float]
+
+def quadratic_roots(a, b, c) ->tuple:
+    'Solve a*x**2+b*x+c=0 elementwise; returns the smaller and larger real root, NaN where there is none'
+    a,b,c=np.broadcast_arrays(*(np.asarray(v,dtype=float) for v in (a,b,c)))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        disc=b*b-4*a*c
+        # A tangent crossing (double root) can come out slightly negative from round-off
+        disc=np.where((disc<0)&(disc>=-1e-9*np.maximum(b*b,np.abs(4*a*c))),0.0,disc)
+        q=-0.5*(b+np.copysign(np.sqrt(disc),b))     #Avoids cancellation between b and the square root
+        r1=np.where(a!=0,q/a,np.where(b!=0,-c/b,np.nan))
+        r2=np.where(a!=0,c/q,np.nan)
+        r2=np.where(r2==r1,np.nan,r2)
+    return np.fmin(r1,r2),np.where(np.isnan(r1)|np.isnan(r2),np.nan,np.fmax(r1,r2))
+
+def elevation_crossings(x0, e0, g1, a, x1, elevations) ->np.ndarray:
+    'Find where parabolas e0+g1*u+a*u**2 (u=station-x0, x0<=station<=x1) reach target elevations; (..., 2) stations, NaN padded'
+    x0,x1=np.asarray(x0,dtype=float),np.asarray(x1,dtype=float)
+    e0,g1,a,elevations=(np.asarray(v,dtype=float) for v in (e0,g1,a,elevations))
+    roots=np.stack(quadratic_roots(a,g1,e0-elevations),axis=-1)+x0[...,None]
+    # Near the high/low point an elevation error d moves the roots by sqrt(d/a), so targets
+    # within round-off of the vertex elevation are put on the vertex
+    with np.errstate(divide='ignore',invalid='ignore'):
+        vertex=-g1/(2*a)
+        near=(a!=0)&(np.abs(elevations-(e0+g1*vertex/2))<=1e-12*np.maximum(np.abs(elevations),np.abs(e0)))
+    roots=np.where(near[...,None],np.stack(np.broadcast_arrays(x0+vertex,np.nan),axis=-1),roots)
+    lo,hi=x0[...,None],x1[...,None]
+    # Allow for round-off when the target is the PVC or PVT elevation
+    tolerance=1e-9*np.maximum(hi-lo,1.0)
+    roots=np.where((roots>=lo-tolerance)&(roots<=hi+tolerance),np.clip(roots,lo,hi),np.nan)
+    # Keep the valid roots first and merge the two roots of a tangent crossing (high/low point)
+    roots=np.where(np.isnan(roots[...,:1]),roots[...,::-1],roots)
+    double=np.abs(roots[...,1]-roots[...,0])<=1e-6*np.maximum(x1-x0,1.0)
+    roots[...,0]=np.where(double,(roots[...,0]+roots[...,1])/2,roots[...,0])
+    roots[...,1]=np.where(double,np.nan,roots[...,1])
+    return roots
+
+def slope_crossings(x0, e0, g1, a, x1, slopes) ->np.ndarray:
+    'Find where parabolas e0+g1*u+a*u**2 (u=station-x0, x0<=station<=x1) reach target slopes, NaN where they do not'
+    with np.errstate(divide='ignore',invalid='ignore'):
+        stations=x0+(np.asarray(slopes,dtype=float)-g1)/(2*np.asarray(a,dtype=float))
+    return np.where((stations>=x0)&(stations<=x1),stations,np.nan)
+
 class VerticalParabolicCurve:
     # Models a vertical parabolic curve for the roadway vertical alignment
+    #
+    # Setting PVI, g1, g2 or Length only marks the curve as changed. The derived
+    # geometry (PVC, PVT, curve type, high/low point and the polynomial coefficients)
+    # is recomputed once, on the first read after a change.
 
     #Initialize a new vertical parabolic curve with default values
     def __init__(self):
         self._data=TVerticalCurve(PVI=VerticalPoint(),PVC=VerticalPoint(), PVT=VerticalPoint(), High_low_point=VerticalPoint(), is_initialized=False)
+        self._dirty=False
+        self._coeffs=None   #(PVC station, PVC elevation, g1, (g2-g1)/(2L), PVT station)
+        self._revision=0
     
     @property
     def PVC(self) ->VerticalPoint:
         "Get the point of vertical curvature (start of the curve)"
+        self._refresh()
         return self._data.PVC
     
     @property
     def PVT(self)   ->VerticalPoint:
         "Get the point of vertical tangency"
+        self._refresh()
         return self._data.PVT
 
     @property
@@ -57,12 +138,11 @@ class VerticalParabolicCurve:
 
     @PVI.setter
     def PVI(self, value:VerticalPoint) ->VerticalPoint:
-        "Set the PVI and update the curve if possible"
+        "Set the PVI and mark the curve for recomputation"
         if value is None:
             raise ValueError("PVI cannot be None")
         self._data.PVI=value
-        if self._data.Length>0 and self._data.g1 !=0 and self._data.g2 !=0:
-            self._update_curve()
+        self._invalidate()
 
     @property
     def g1(self) ->float:
@@ -71,22 +151,20 @@ class VerticalParabolicCurve:
     
     @g1.setter
     def g1(self, value:float) ->float:
-        "Set the incoming grade and update the curve if possible"
+        "Set the incoming grade and mark the curve for recomputation"
         self._data.g1 = value
-        if self._data.PVI is not None and self._data.Length>0 and self._data.g2!=0:
-            self._update_curve()
+        self._invalidate()
 
     @property
     def g2(self) ->float:
-        "Get the incoming grade"
+        "Get the outgoing grade"
         return self._data.g2
     
     @g2.setter
     def g2(self, value:float) ->float:
-        "Set the incoming grade and update the curve if possible"
+        "Set the outgoing grade and mark the curve for recomputation"
         self._data.g2 = value
-        if self._data.PVI is not None and self._data.Length>0 and self._data.g1!=0:
-            self._update_curve()
+        self._invalidate()
         
     @property
     def Length(self) ->float:
@@ -95,45 +173,126 @@ class VerticalParabolicCurve:
     
     @Length.setter
     def Length(self, value:float) ->float:
-        "Set the horizontal length of the curve and update the curve if possible"
+        "Set the horizontal length of the curve and mark the curve for recomputation"
         self._data.Length = value
-        if self._data.PVI is not None and self._data.g2!=0 and self._data.g1!=0:
-            self._update_curve()
+        self._invalidate()
 
     @property
     def Curve_type(self) ->VerticalCurveType:
         "Get the curve type (crest or sag)"
+        self._refresh()
         return self._data.Curve_type
     
     @property
     def High_low_point(self) ->VerticalPoint:
         'Get the high or low point of the curve'
+        self._refresh()
         return self._data.High_low_point
+
+    @property
+    def is_initialized(self) ->bool:
+        'Check whether the curve has enough input to be evaluated'
+        self._refresh()
+        return self._data.is_initialized
+
+    def configure(self, PVI:Optional[VerticalPoint]=None, g1:Optional[float]=None, g2:Optional[float]=None, Length:Optional[float]=None) ->'VerticalParabolicCurve':
+        'Set several curve inputs at once with a single recomputation'
+        if PVI is not None:
+            self._data.PVI=PVI
+        if g1 is not None:
+            self._data.g1=g1
+        if g2 is not None:
+            self._data.g2=g2
+        if Length is not None:
+            self._data.Length=Length
+        self._invalidate()
+        return self
+
+    @contextmanager
+    def editing(self):
+        'Group several setter calls; the inputs are restored if the block raises'
+        saved=(self._data.PVI,self._data.g1,self._data.g2,self._data.Length)
+        try:
+            yield self
+        except BaseException:
+            self._data.PVI,self._data.g1,self._data.g2,self._data.Length=saved
+            self._invalidate()
+            raise
+        self._refresh()
+
+    @property
+    def revision(self) ->int:
+        'Get a counter that changes whenever an input of the curve changes'
+        return self._revision
+
+    def _invalidate(self):
+        'Mark the derived geometry as out of date'
+        self._dirty=True
+        self._revision+=1
+        self._data.is_initialized=False
+
+    def _refresh(self):
+        'Recompute the derived geometry if an input changed since the last read'
+        if self._dirty and self._data.PVI is not None and self._data.Length>0:
+            self._update_curve()
     
     def elevation_at(self,station:float) ->float:
         'Calculate the elevation at a given station along the curve'
+        self._refresh()
         if not self._data.is_initialized:
             raise ValueError("Curve not initialized")
-        if station< self._data.PVC.station or station> self._data.PVT.station:
+        x0,e0,g1,a,x1=self._coeffs
+        if station<x0 or station>x1:
            logging.warning("Station must be within the curve length")
            return None
-        else:
-            return (self._data.g2-self._data.g1)/(2*self._data.Length)*(station-self._data.PVC.station)**2+self._data.g1*(station-self._data.PVC.station)+self._data.PVC.elevation
+        x=station-x0
+        return (a*x+g1)*x+e0
 
 
     def slope_at(self,station:float) ->float:
-        'Calculate the elevation at a given station along the curve'
+        'Calculate the slope at a given station along the curve'
+        self._refresh()
         if not self._data.is_initialized:
             raise ValueError("Curve not initialized")
-        if station< self._data.PVC.station or station> self._data.PVT.station:
+        x0,_,g1,a,x1=self._coeffs
+        if station<x0 or station>x1:
             logging.warning("Station must be within the curve length")
             return None
-        return (self._data.g2-self._data.g1)/(self._data.Length)*(station-self._data.PVC.station)+self._data.g1
+        return 2*a*(station-x0)+g1
 
+    def stations_in_range(self,stations) ->np.ndarray:
+        'Return a boolean mask of the stations that lie between PVC and PVT'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        stations=np.asarray(stations,dtype=float)
+        return (stations>=self._coeffs[0])&(stations<=self._coeffs[4])
+
+    def elevations_at(self,stations) ->np.ndarray:
+        'Calculate the elevations at an array of stations, NaN outside the curve'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        x0,e0,g1,a,x1=self._coeffs
+        stations=np.asarray(stations,dtype=float)
+        x=stations-x0
+        elevations=(a*x+g1)*x+e0
+        return np.where((stations<x0)|(stations>x1),np.nan,elevations)
+
+    def slopes_at(self,stations) ->np.ndarray:
+        'Calculate the slopes at an array of stations, NaN outside the curve'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        x0,_,g1,a,x1=self._coeffs
+        stations=np.asarray(stations,dtype=float)
+        slopes=2*a*(stations-x0)+g1
+        return np.where((stations<x0)|(stations>x1),np.nan,slopes)
 
     
     def distance_to_High_low_point(self)    ->float:
         'Calculate the horizontal distance from PVC to high/low point (if it exists)'
+        self._refresh()
         if not self._data.is_initialized:
             raise ValueError("Curve not initialized")
         if self._data.High_low_point is None:
@@ -143,6 +302,7 @@ class VerticalParabolicCurve:
 
     def projectpoint_at(self,point:VerticalPoint) ->VerticalPoint:
         'Project a point onto the curve by finding the closest point'
+        self._refresh()
         if not self._data.is_initialized:
             raise ValueError("Curve not initialized")
         if point is None:
@@ -153,31 +313,97 @@ class VerticalParabolicCurve:
         elif point.station>=self._data.PVT.station:
             return VerticalPoint(self._data.PVT.station,self._data.PVT.elevation)
         else:
-            return VerticalPoint(point.station,self.elevation_at(point.station))
+            x0,e0,g1,a,_=self._coeffs
+            x=point.station-x0
+            return VerticalPoint(point.station,(a*x+g1)*x+e0)
+
+    def project_points(self,stations,elevations,clamp:bool=True) ->tuple:
+        'Project arrays of points onto the curve and return the design elevations and the vertical offsets (point minus design)'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        x0,e0,g1,a,x1=self._coeffs
+        stations=np.asarray(stations,dtype=float)
+        if clamp:
+            stations=np.clip(stations,x0,x1)
+        x=stations-x0
+        design=(a*x+g1)*x+e0
+        if not clamp:
+            design=np.where((stations<x0)|(stations>x1),np.nan,design)
+        return design,np.asarray(elevations,dtype=float)-design
+
+    def stations_at_elevations(self,elevations) ->np.ndarray:
+        'Find the stations where the curve reaches each elevation: an (n, 2) array, NaN where there is no crossing (or where a flat curve lies at that elevation)'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        return elevation_crossings(*self._coeffs,elevations)
+
+    def stations_at_slopes(self,slopes) ->np.ndarray:
+        'Find the station where the curve reaches each slope, NaN where it does not (or where g1==g2 equals that slope)'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        return slope_crossings(*self._coeffs,slopes)
+
+    def stations_at_elevation(self,elevation:float) ->list:
+        'Find all stations between PVC and PVT where the curve reaches an elevation (ValueError if a flat curve lies at it)'
+        roots=self.stations_at_elevations(elevation)
+        x0,e,g,a=self._coeffs[:4]
+        if a==0 and g==0 and e==elevation:
+            raise ValueError("The curve is flat at this elevation, every station between PVC and PVT reaches it")
+        return [float(r) for r in roots if r==r]
+
+    def stations_at_slope(self,slope:float) ->list:
+        'Find the station between PVC and PVT where the curve reaches a slope (empty if none, ValueError if g1==g2==slope)'
+        station=float(self.stations_at_slopes(slope))
+        if self._coeffs[3]==0 and self._coeffs[2]==slope:
+            raise ValueError("The curve has a constant grade equal to this slope, every station between PVC and PVT reaches it")
+        return [station] if station==station else []
+
+    def pieces(self) ->tuple:
+        'Get the curve as a single polynomial piece: (starts, ends, elevations, grades, half rates) arrays'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        x0,e0,g1,a,x1=self._coeffs
+        return np.array([x0]),np.array([x1]),np.array([e0]),np.array([g1]),np.array([a])
 
     def create_offset_curve(self, offset: float) -> 'VerticalParabolicCurve':
         """Create a parallel vertical curve offset vertically."""
+        self._refresh()
         if not self._data.is_initialized:
             raise ValueError("Curve not initialized")
 
         offset_curve = VerticalParabolicCurve()
-        offset_curve.PVI = VerticalPoint(self._data.PVI.station, self._data.PVI.elevation + offset)
-        offset_curve.Length = self._data.length
-        offset_curve.g1 = self._data.g1
-        offset_curve.g2 = self._data.g2
-        offset_curve._update_curve()
-        return offset_curve
+        return offset_curve.configure(PVI=VerticalPoint(self._data.PVI.station, self._data.PVI.elevation + offset),
+                                      g1=self._data.g1, g2=self._data.g2, Length=self._data.Length)
 
     def _update_curve(self):
         'Update all the geometric properties and points'
         self._update_PVC()
         self._update_PVT()
         self._update_CurveType()
-        self._data.is_initialized=True
+        self._update_coeffs()
 
         self._update_high_low_point()
+
+    def _update_coeffs(self):
+        'Cache the polynomial coefficients used by the evaluation methods'
+        self._coeffs=(self._data.PVC.station, self._data.PVC.elevation, self._data.g1,
+                      (self._data.g2-self._data.g1)/(2*self._data.Length), self._data.PVT.station)
+        self._dirty=False
         self._data.is_initialized=True
 
+    def solution(self) ->CurveSolution:
+        'Get the derived geometry of the curve as plain numbers'
+        self._refresh()
+        if not self._data.is_initialized:
+            raise ValueError("Curve not initialized")
+        high_low=self._data.High_low_point
+        return CurveSolution(self._data.PVC.station, self._data.PVC.elevation, self._data.PVT.station, self._data.PVT.elevation,
+                             self._data.Curve_type, high_low.station if high_low else None, high_low.elevation if high_low else None)
+
     def _update_PVC(self):
         'Calculate the PVC based on PVI, Length, and the Grades'
         PVC_station=self._data.PVI.station-self._data.Length/2
@@ -203,13 +429,101 @@ class VerticalParabolicCurve:
         a=self._data.g2-self._data.g1
         if a==0:
             self._data.High_low_point= None
-            self._data.is_initialized = True  # Still mark as initialized
             return
         X=-(self._data.g1/a)*self._data.Length
         if 0<=X<=self._data.Length:
             station=self._data.PVC.station+X
-            elevation=self.elevation_at(station)
+            elevation=(self._coeffs[3]*X+self._data.g1)*X+self._data.PVC.elevation
             self._data.High_low_point=VerticalPoint(station,elevation)
         else:
             self._data.High_low_point=None
-            self._data.is_initialized = True  # Still mark as initialized
+
+
+
+# Opt-in instrumentation of the hot paths.
+#
+# enable_instrumentation() wraps the methods below with counting/timing wrappers and
+# disable_instrumentation() puts the original methods back, so there is no overhead at
+# all while it is off. Counters are plain integers updated without a lock, so values
+# from several threads are approximate.
+
+# method name -> counter name ("edits" counts input changes, "recompute" the _update_curve runs)
+_INSTRUMENTED={'_invalidate':'edits','_update_curve':'recompute','elevation_at':'elevation_at','slope_at':'slope_at',
+               'elevations_at':'elevations_at','slopes_at':'slopes_at','projectpoint_at':'projectpoint_at','project_points':'project_points'}
+_original_methods={}
+_stats={}
+_sink=None
+
+def _new_stats() ->dict:
+    return {name:{'calls':0,'items':0,'out_of_range':0,'seconds':0.0} for name in _INSTRUMENTED.values()}
+
+def _instrumented(name:str, method):
+    'Wrap a VerticalParabolicCurve method so that it updates the counters'
+    array_result=name in ('elevations_at','slopes_at')
+    clock=time.perf_counter
+    key=_INSTRUMENTED[name]
+
+    @functools.wraps(method)
+    def wrapper(self,*args,**kwargs):
+        start=clock()
+        result=None
+        try:
+            result=method(self,*args,**kwargs)
+            return result
+        finally:
+            entry=_stats[key]
+            entry['seconds']+=clock()-start
+            entry['calls']+=1
+            if array_result and result is not None:
+                entry['items']+=result.size
+                entry['out_of_range']+=int(np.count_nonzero(np.isnan(result)))
+            elif name=='project_points' and result is not None:
+                entry['items']+=result[0].size
+            else:
+                entry['items']+=1
+                if result is None and name in ('elevation_at','slope_at'):
+                    entry['out_of_range']+=1
+    return wrapper
+
+def enable_instrumentation(sink=None):
+    'Start counting and timing recomputations, evaluations and projections; sink receives snapshots on flush'
+    global _sink
+    _sink=sink
+    if _original_methods:
+        return
+    _stats.update(_new_stats())
+    for name in _INSTRUMENTED:
+        method=VerticalParabolicCurve.__dict__[name]
+        _original_methods[name]=method
+        setattr(VerticalParabolicCurve,name,_instrumented(name,method))
+
+def disable_instrumentation():
+    'Flush the counters to the sink and restore the uninstrumented methods'
+    global _sink
+    if not _original_methods:
+        return
+    flush_instrumentation()
+    for name,method in _original_methods.items():
+        setattr(VerticalParabolicCurve,name,method)
+    _original_methods.clear()
+    _sink=None
+
+def instrumentation_enabled() ->bool:
+    'Check whether the hot paths are currently instrumented'
+    return bool(_original_methods)
+
+def instrumentation_snapshot() ->dict:
+    'Get a copy of the counters'
+    return {name:dict(entry) for name,entry in _stats.items()}
+
+def reset_instrumentation():
+    'Set all counters back to zero'
+    if _stats:
+        _stats.update(_new_stats())
+
+def flush_instrumentation() ->dict:
+    'Send a snapshot of the counters to the sink (if any) and return it'
+    snapshot=instrumentation_snapshot()
+    if _sink is not None:
+        _sink(snapshot)
+    return snapshot
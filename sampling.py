@@ -0,0 +1,70 @@
+from typing import Optional
+import numpy as np
+
+# Polyline sampling of a VerticalParabolicCurve or VerticalProfile for drawing.
+#
+# Both designs expose pieces() as polynomial pieces elevation = e + g*u + a*u**2
+# (u = station - start). The chord of a piece over a step h deviates from the
+# parabola by at most |a|*h**2/4, so each piece gets just enough samples to stay
+# within max_error; tangents need only their end points. Passing start/end samples
+# only that station range, e.g. the range reported by a VerticalProfile edit.
+
+
+def _clip_pieces(pieces:tuple, start:Optional[float], end:Optional[float]) ->tuple:
+    'Restrict pieces to the station range start..end, re-basing the ones cut at start'
+    starts,ends,elevations,grades,rates=pieces
+    low=starts[0] if start is None else start
+    high=ends[-1] if end is None else end
+    keep=(ends>=low)&(starts<=high)
+    if not keep.any():
+        raise ValueError("The station range does not overlap the design")
+    starts,ends,elevations,grades,rates=(a[keep] for a in pieces)
+    shift=np.maximum(low-starts,0.0)
+    return starts+shift,np.minimum(ends,high),elevations+(grades+rates*shift)*shift,grades+2*rates*shift,rates
+
+
+def _chord_counts(lengths:np.ndarray, rates:np.ndarray, max_error:float) ->np.ndarray:
+    'Get the number of chords each piece needs to stay within max_error'
+    if max_error<=0:
+        raise ValueError("The chord error tolerance must be positive")
+    return np.where(lengths>0,np.maximum(np.ceil(lengths*np.sqrt(np.abs(rates)/(4*max_error))),1),0).astype(np.int64)
+
+
+def chord_count(design, max_error:float, start:Optional[float]=None, end:Optional[float]=None) ->int:
+    'Count the chords sample() needs to stay within max_error, i.e. whether a max_points budget would limit it'
+    starts,ends,_,_,rates=_clip_pieces(design.pieces(),start,end)
+    return int(_chord_counts(ends-starts,rates,max_error).sum())
+
+
+def sample(design, max_error:float, max_points:Optional[int]=None, start:Optional[float]=None, end:Optional[float]=None) ->tuple:
+    'Sample a design (or its stations start..end) into (stations, elevations) arrays whose chords stay within max_error of it'
+    starts,ends,elevations,grades,rates=_clip_pieces(design.pieces(),start,end)
+    lengths=ends-starts
+    counts=_chord_counts(lengths,rates,max_error)
+    if max_points is not None and counts.sum()>max_points:
+        # Spread the point budget over the curved pieces in proportion to what they asked for
+        curved=counts>1
+        budget=max(max_points-int(np.count_nonzero(counts==1)),int(np.count_nonzero(curved)))
+        counts[curved]=np.maximum(counts[curved]*budget//counts[curved].sum(),1)
+    piece=np.repeat(np.arange(len(counts)),counts)
+    first=np.cumsum(counts)-counts
+    u=(np.arange(len(piece))-first[piece])/counts[piece]*lengths[piece]
+    stations=np.append(starts[piece]+u,ends[-1])
+    u_end=ends[-1]-starts[-1]
+    values=np.append(elevations[piece]+(grades[piece]+rates[piece]*u)*u,elevations[-1]+(grades[-1]+rates[-1]*u_end)*u_end)
+    return stations,values
+
+
+def elevation_extents(design) ->tuple:
+    'Get the lowest and highest elevation of a design from its piece end points and vertices'
+    starts,ends,elevations,grades,rates=design.pieces()
+    lengths=ends-starts
+    candidates=[elevations,elevations+(grades+rates*lengths)*lengths]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        u=-grades/(2*rates)
+    inside=(rates!=0)&(u>0)&(u<lengths)
+    if inside.any():
+        u=u[inside]
+        candidates.append(elevations[inside]+(grades[inside]+rates[inside]*u)*u)
+    values=np.concatenate(candidates)
+    return float(values.min()),float(values.max())
@@ -0,0 +1,135 @@
+from typing import List, NamedTuple, Optional
+import numpy as np
+from design import EYE_HEIGHT, STOPPING_OBJECT_HEIGHT, PASSING_OBJECT_HEIGHT, passing_sight_distance, stopping_sight_distance
+from parabolic import quadratic_roots
+
+# Available sight distance along a VerticalParabolicCurve or VerticalProfile.
+#
+# From an eye at station s (elevation E = z(s) + eye height) an object at station t
+# is visible when its sight line clears the road: the slope from the eye to the
+# object top is at least the horizon slope M, the steepest slope from the eye to any
+# road point between s and t. The sweep walks the pieces (z = e + g*u + a*u**2)
+# downstream of every station at once, keeping M per station:
+#   - within a piece the object first disappears where z(t) + object height - E - M*(t-s)
+#     turns negative, a quadratic solved in closed form;
+#   - M only grows inside a crest piece, up to the point where the sight line is tangent
+#     to the parabola (u = -d + sqrt(d**2 - K/a), d = start - s, K = g*d - e + E), so crest
+#     pieces are split there; on tangents and sags the road slope seen from the eye is
+#     monotone or has a minimum, and M is updated at the piece ends.
+# Each pass handles one piece for all stations still looking, so the number of passes
+# is the number of pieces within the longest sight distance.
+
+
+class SightDistanceCheck(NamedTuple):
+    "Result of a sight distance check along a design"
+    stations:np.ndarray     #Stations of the eye
+    available:np.ndarray    #Available sight distance, capped at the distance that was checked
+    required:np.ndarray     #Required sight distance at each station
+    limited:np.ndarray      #True where the design ends before the required distance could be checked
+    deficient:np.ndarray    #True where the available distance is shorter than required
+    ranges:List[tuple]      #(start, end) stations of each run of deficient stations
+
+
+def _mirrored(pieces:tuple) ->tuple:
+    'Reflect pieces about station 0 so that a backward sweep becomes a forward one'
+    starts,ends,elevations,grades,rates=pieces
+    lengths=ends-starts
+    return (-ends[::-1],-starts[::-1],(elevations+(grades+rates*lengths)*lengths)[::-1],
+            (-(grades+2*rates*lengths))[::-1],rates[::-1])
+
+
+def _first_hidden(lo, hi, x0, e, g, a, s, E, M, object_height:float) ->np.ndarray:
+    'Find the first station in lo..hi where the object drops below the horizon slope M, NaN if none'
+    visible=~np.isfinite(M)|(hi<=lo)
+    M=np.where(visible,0.0,M)
+    B=g-M
+    C=e+object_height-E-M*(x0-s)
+    u0=lo-x0
+    hidden=np.where((a*u0+B)*u0+C<-1e-9,lo,np.nan)
+    for root in quadratic_roots(a,B,C):
+        falling=(2*a*root+B<0)&(root+x0>lo)&(root+x0<=hi)
+        hidden=np.fmin(hidden,np.where(falling,root+x0,np.nan))
+    return np.where(visible,np.nan,hidden)
+
+
+def _ray_slope(x, x0, e, g, a, s, E) ->np.ndarray:
+    'Get the slope from the eye to the road at x (minus infinity at the eye)'
+    u=x-x0
+    with np.errstate(divide='ignore',invalid='ignore'):
+        return np.where(x>s,(e+(g+a*u)*u-E)/(x-s),-np.inf)
+
+
+def available_sight_distance(design, stations, eye_height:float=EYE_HEIGHT, object_height:float=STOPPING_OBJECT_HEIGHT,
+                             direction:str='forward', max_distance:Optional[float]=None) ->np.ndarray:
+    'Calculate the available sight distance from each station, capped at max_distance and the end of the design (NaN outside it)'
+    if direction not in ('forward','backward'):
+        raise ValueError("Direction must be 'forward' or 'backward'")
+    if eye_height<=0 or object_height<=0:
+        raise ValueError("Eye and object heights must be positive")
+    pieces=design.pieces()
+    stations=np.asarray(stations,dtype=float)
+    s=stations.ravel()
+    if direction=='backward':
+        pieces=_mirrored(pieces)
+        s=-s
+    starts,ends,elevations,grades,rates=pieces
+    last=len(starts)-1
+    available=np.full(s.shape,np.nan)
+    idx=np.nonzero((s>=starts[0])&(s<=ends[-1]))[0]
+    s=s[idx]
+    limit=np.full(s.shape,ends[-1]) if max_distance is None else np.minimum(s+max_distance,ends[-1])
+    k=np.clip(np.searchsorted(starts,s,side='right')-1,0,last)
+    u=s-starts[k]
+    E=elevations[k]+(grades[k]+rates[k]*u)*u+eye_height
+    M=np.full(s.shape,-np.inf)
+    while idx.size:
+        x0,e,g,a=starts[k],elevations[k],grades[k],rates[k]
+        lo=np.maximum(x0,s)
+        hi=np.minimum(ends[k],limit)
+        d=x0-s
+        with np.errstate(divide='ignore',invalid='ignore'):
+            w=-d+np.sqrt(d*d-(g*d-e+E)/a)
+        tangent=np.where((a<0)&~np.isnan(w),np.clip(x0+w,lo,hi),lo)
+        hidden=_first_hidden(lo,tangent,x0,e,g,a,s,E,M,object_height)
+        M=np.maximum(M,_ray_slope(tangent,x0,e,g,a,s,E))
+        hidden=np.fmin(hidden,_first_hidden(tangent,hi,x0,e,g,a,s,E,M,object_height))
+        M=np.maximum(M,_ray_slope(hi,x0,e,g,a,s,E))
+        found=~np.isnan(hidden)
+        available[idx[found]]=hidden[found]-s[found]
+        finished=~found&((hi>=limit)|(k>=last))
+        available[idx[finished]]=limit[finished]-s[finished]
+        keep=~(found|finished)
+        idx,s,limit,k,E,M=idx[keep],s[keep],limit[keep],k[keep]+1,E[keep],M[keep]
+    return available.reshape(stations.shape)
+
+
+def _runs(stations:np.ndarray, mask:np.ndarray) ->List[tuple]:
+    'Get the (start, end) stations of each run of True values in mask'
+    edges=np.diff(np.concatenate(([0],mask.astype(np.int8),[0])))
+    first=np.nonzero(edges==1)[0]
+    last=np.nonzero(edges==-1)[0]-1
+    return [(float(stations[i]),float(stations[j])) for i,j in zip(first,last)]
+
+
+def check_sight_distance(design, speed=None, sight_distance=None, spacing:float=10.0, passing:bool=False,
+                         eye_height:float=EYE_HEIGHT, object_height:Optional[float]=None,
+                         direction:str='forward', stations=None) ->SightDistanceCheck:
+    'Compare the available sight distance at stations spaced along a design with the required stopping (or passing) distance'
+    if sight_distance is None:
+        if speed is None:
+            raise ValueError("Either a design speed or a sight distance is required")
+        sight_distance=passing_sight_distance(speed) if passing else stopping_sight_distance(speed)
+    if object_height is None:
+        object_height=PASSING_OBJECT_HEIGHT if passing else STOPPING_OBJECT_HEIGHT
+    starts,ends=design.pieces()[:2]
+    if stations is None:
+        if spacing<=0:
+            raise ValueError("The station spacing must be positive")
+        stations=np.arange(starts[0],ends[-1],spacing)
+    stations=np.asarray(stations,dtype=float)
+    required=np.broadcast_to(np.asarray(sight_distance,dtype=float),stations.shape)
+    available=available_sight_distance(design,stations,eye_height,object_height,direction,float(required.max()))
+    room=ends[-1]-stations if direction=='forward' else stations-starts[0]
+    limited=room<required
+    deficient=(available<required-1e-9)&~(limited&(available>=room-1e-9))
+    return SightDistanceCheck(stations,available,required,limited,deficient,_runs(stations,deficient))
@@ -0,0 +1,67 @@
+import os
+from typing import Iterator, NamedTuple, Optional
+import numpy as np
+
+# Bulk projection of survey/LiDAR ground shots onto a design curve or profile.
+#
+# Survey files are flat little-endian binary records of (station, elevation) float64
+# pairs, opened with np.memmap so files larger than RAM stream through in chunks.
+# Offsets are point elevation minus design elevation: positive means the ground is
+# above design (cut / clearance), negative means it is below (fill).
+
+SURVEY_DTYPE=np.dtype([('station','<f8'),('elevation','<f8')])
+RESULT_DTYPE=np.dtype([('design','<f8'),('offset','<f8')])
+
+
+class ProjectionSummary(NamedTuple):
+    "Totals collected while projecting a survey file"
+    count:int       #Number of projected points
+    cut:int         #Points above design
+    fill:int        #Points below design
+    max_cut:float   #Largest positive offset (NaN if none)
+    max_fill:float  #Largest negative offset as a positive depth (NaN if none)
+
+
+def open_survey(path:str, dtype:np.dtype=SURVEY_DTYPE) ->np.ndarray:
+    'Map a binary survey file of (station, elevation) records without reading it (an empty file gives an empty array)'
+    if os.path.getsize(path)==0:
+        return np.empty(0,dtype=dtype)     #np.memmap cannot map an empty file
+    return np.memmap(path,dtype=dtype,mode='r')
+
+
+def project_chunks(design, stations, elevations, chunk_size:int=1<<20, clamp:bool=True) ->Iterator[tuple]:
+    'Yield (start index, design elevations, offsets) for consecutive chunks of points'
+    if chunk_size<=0:
+        raise ValueError("Chunk size must be positive")
+    for start in range(0,len(stations),chunk_size):
+        stop=start+chunk_size
+        design_elevations,offsets=design.project_points(stations[start:stop],elevations[start:stop],clamp)
+        yield start,design_elevations,offsets
+
+
+def project_file(design, path:str, output_path:Optional[str]=None, chunk_size:int=1<<20, clamp:bool=True) ->ProjectionSummary:
+    'Project every point of a survey file onto a design, optionally writing (design, offset) records'
+    points=open_survey(path)
+    output=None
+    if output_path:
+        if len(points):
+            output=np.memmap(output_path,dtype=RESULT_DTYPE,mode='w+',shape=points.shape)
+        else:
+            open(output_path,'wb').close()
+    cut=fill=0
+    max_cut=max_fill=np.nan
+    for start,design_elevations,offsets in project_chunks(design,points['station'],points['elevation'],chunk_size,clamp):
+        if output is not None:
+            output['design'][start:start+len(offsets)]=design_elevations
+            output['offset'][start:start+len(offsets)]=offsets
+        above=offsets[offsets>0]
+        below=offsets[offsets<0]
+        cut+=len(above)
+        fill+=len(below)
+        if len(above):
+            max_cut=np.fmax(max_cut,above.max())
+        if len(below):
+            max_fill=np.fmax(max_fill,-below.min())
+    if output is not None:
+        output.flush()
+    return ProjectionSummary(len(points),cut,fill,float(max_cut),float(max_fill))
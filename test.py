@@ -1,5 +1,12 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
 import parabolic
 
+IMPORT_BUDGET=0.1    #Seconds allowed for `import parabolic` in a fresh interpreter
+
 def test_vertical_curve(pvi_station, pvi_elevation, length, g1, g2, station):
     print(f"\nTesting curve with PVI=({pvi_station}, {pvi_elevation}), Length={length}, G1={g1}, G2={g2}")
     curve=parabolic.VerticalParabolicCurve()
@@ -17,6 +24,361 @@ def test_vertical_curve(pvi_station, pvi_elevation, length, g1, g2, station):
     print(f"Distance to high/low point: {distance:.2f}" if distance is not None else "No high/low point")
     print(f"Curve type: {curve.Curve_type.name}")
 
+def test_import_budget(attempts=3):
+    code="import sys,time; t=time.perf_counter(); import parabolic; print(time.perf_counter()-t, 'numpy' in sys.modules, 'PyQt6' in sys.modules)"
+    runs=[subprocess.run([sys.executable,'-c',code],capture_output=True,text=True,check=True).stdout.split() for _ in range(attempts)]
+    seconds=min(float(r[0]) for r in runs)
+    print(f"\nImport time of parabolic: {seconds*1000:.1f} ms (budget {IMPORT_BUDGET*1000:.0f} ms)")
+    assert all(r[1]=='False' and r[2]=='False' for r in runs), "Importing parabolic must not import NumPy or PyQt6"
+    assert seconds<=IMPORT_BUDGET, f"Importing parabolic took {seconds*1000:.1f} ms"
+
+def test_curve_file():
+    import numpy as np
+    import curve_file
+    from curveset import CurveSet
+    from vertical_profile import VerticalProfile
+    print("\nTesting curve file round trips")
+    folder=tempfile.mkdtemp()
+    path=os.path.join(folder,'curves.pvcf')
+    curves=CurveSet([1000.,2500.,4000.],[100.,120.,95.],[0.02,-0.03,0.01],[-0.01,0.02,0.01],[200.,300.,150.])
+    names=CurveSet.INPUTS+CurveSet.DERIVED+('curve_type',)
+    def same(a,b):
+        return all(np.array_equal(getattr(a,n),getattr(b,n),equal_nan=True) for n in names)
+    for derived in (True,False):
+        curve_file.save_curve_set(path,curves,derived)
+        assert same(curve_file.load_curve_set(path),curves), f"save/load changed the curves (derived={derived})"
+    loaded=curve_file.load_curve_set(path)
+    try:
+        loaded[0].g1=0.05
+        raise AssertionError("A read-only curve set accepted an edit")
+    except ValueError:
+        pass
+    editable=curve_file.load_curve_set(path,writable=True)
+    editable[0].g1=0.05
+    assert editable.pvc_elevation[0]==100-0.05*100 and same(curve_file.load_curve_set(path),curves), "writable=True must edit in memory only"
+    stream=io.StringIO()
+    curve_file.to_csv(path,stream)
+    stream.seek(0)
+    assert curve_file.from_csv(stream,path)=='curves' and same(curve_file.load_curve_set(path),curves), "CSV round trip changed the curves"
+    print(f"Curve set: {len(curves)} curves saved, loaded and converted through CSV")
+
+    profile=VerticalProfile([parabolic.VerticalPoint(0,100),parabolic.VerticalPoint(500,110),parabolic.VerticalPoint(900,104),parabolic.VerticalPoint(1400,112)],[0,200,160,0])
+    curve_file.save_profile(path,profile)
+    stream=io.StringIO()
+    curve_file.to_csv(path,stream)
+    stream.seek(0)
+    for loaded in (curve_file.load_profile(path),(curve_file.from_csv(stream,path),curve_file.load_profile(path))[1]):
+        assert all(np.array_equal(a,b) for a,b in zip(loaded.pieces(),profile.pieces())), "Profile round trip changed the pieces"
+    print(f"Profile: {len(profile)} PVIs saved, loaded and converted through CSV")
+
+    def fails(message,func,*args):
+        try:
+            func(*args)
+        except ValueError as e:
+            assert message in str(e), f"Expected {message!r}, got {e}"
+            return
+        raise AssertionError(f"Expected an error containing {message!r}")
+    bad=os.path.join(folder,'bad.pvcf')
+    with open(path,'rb') as f:
+        data=f.read()
+    for content,message in ((b'XXXX'+data[4:],"is not a curve file"),(data[:16],"too short"),(data[:40],"corrupt column table"),(data[:100],"corrupt column table")):
+        with open(bad,'wb') as f:
+            f.write(content)
+        fails(message,curve_file.load_profile,bad)
+    fails("holds profile data, not curves data",curve_file.load_curve_set,path)
+    fails("missing the columns",curve_file.from_csv,io.StringIO("pvi_station,g1\n1,2\n"),bad)
+    print("Corrupt headers, truncated files and wrong kinds are rejected")
+
+def test_profile_edits(edits=400, seed=7):
+    import numpy as np
+    from vertical_profile import VerticalProfile
+    print(f"\nTesting {edits} random profile edits against rebuilt profiles")
+    rng=np.random.default_rng(seed)
+    stations=np.arange(0.0,5000.0,500.0)
+    profile=VerticalProfile.from_arrays(stations,rng.uniform(90,110,len(stations)),[0]+[100]*(len(stations)-2)+[0])
+    changes=[]
+    profile.subscribe(changes.append)
+    applied={}
+    for _ in range(edits):
+        before=VerticalProfile(profile.PVIs,profile.lengths)
+        revision=profile.revision
+        n=len(profile)
+        kind=str(rng.choice(['move','length','insert','remove']))
+        index=int(rng.integers(0,n))
+        try:
+            if kind=='move':
+                pvi=profile.PVIs[index]
+                profile.move_pvi(index,pvi.station+rng.uniform(-300,300),pvi.elevation+rng.uniform(-5,5))
+            elif kind=='length':
+                profile.set_length(index,rng.uniform(0,400))
+            elif kind=='insert':
+                station=rng.uniform(profile.start_station-600,profile.end_station+600)
+                inside=profile.start_station<station<profile.end_station
+                profile.insert_pvi(parabolic.VerticalPoint(station,rng.uniform(90,110)),rng.uniform(0,150) if inside else 0.0)
+            elif n>3:
+                profile.remove_pvi(index)
+            else:
+                continue
+        except ValueError:
+            # A rejected edit leaves the profile as it was
+            assert profile.revision==revision and all(np.array_equal(a,b) for a,b in zip(profile.pieces(),before.pieces())), f"Rejected {kind} changed the profile"
+            continue
+        applied[kind]=applied.get(kind,0)+1
+        rebuilt=VerticalProfile(profile.PVIs,profile.lengths)
+        assert all(np.allclose(a,b,rtol=0,atol=1e-9) for a,b in zip(profile.pieces(),rebuilt.pieces())), f"{kind} differs from a rebuilt profile"
+        change=changes[-1]
+        assert change.kind==kind and change.revision==profile.revision==revision+1, "Every edit is reported once"
+        x=np.linspace(min(before.start_station,profile.start_station),max(before.end_station,profile.end_station),2001)
+        assert np.allclose(profile.elevations_at(x),rebuilt.elevations_at(x),rtol=0,atol=1e-9,equal_nan=True), f"{kind} evaluates differently"
+        assert all(abs(profile.elevation_at(t)-rebuilt.elevation_at(t))<1e-9 for t in x[::97] if profile.start_station<=t<=profile.end_station), f"{kind} left stale piece starts"
+        # Outside the reported range the elevations must not have changed
+        outside=x[((x<change.start)|(x>change.end))&(x>=max(before.start_station,profile.start_station))&(x<=min(before.end_station,profile.end_station))]
+        assert np.allclose(profile.elevations_at(outside),before.elevations_at(outside),rtol=0,atol=1e-9), f"{kind} changed stations outside {change.start}..{change.end}"
+    print("Applied edits: "+", ".join(f"{count} {kind}" for kind,count in sorted(applied.items())))
+
+def test_sight_distance(step=0.05, eye_height=1.08, object_height=0.60):
+    import numpy as np
+    from sight_distance import available_sight_distance
+    from vertical_profile import VerticalProfile
+    print("\nTesting available sight distance against a brute-force sweep")
+    profile=VerticalProfile.from_arrays([0,400,900,1300,1800],[100,108,101,106,100],[0,250,300,200,0])
+    grid=np.linspace(profile.start_station,profile.end_station,int(round((profile.end_station-profile.start_station)/step))+1)
+    road=profile.elevations_at(grid)
+    stations=np.linspace(profile.start_station,profile.end_station,37)
+    worst=0.0
+    for direction in ('forward','backward'):
+        available=available_sight_distance(profile,stations,eye_height,object_height,direction)
+        for station,distance in zip(stations,available):
+            # Walk the road points away from the eye keeping the steepest sight line to the road so far;
+            # the object is hidden at the first point whose top lies below it
+            ahead=grid>station if direction=='forward' else grid<station
+            d=np.abs(grid[ahead]-station)
+            z=road[ahead]
+            if direction=='backward':
+                d,z=d[::-1],z[::-1]
+            eye=profile.elevation_at(station)+eye_height
+            horizon=np.concatenate(([-np.inf],np.maximum.accumulate((z-eye)/d)[:-1]))
+            hidden=(z+object_height-eye)/d<horizon
+            expected=d[np.argmax(hidden)] if hidden.any() else (d[-1] if len(d) else 0.0)
+            worst=max(worst,abs(distance-expected))
+    print(f"Largest difference from the brute-force sweep: {worst:.3f} (grid step {step})")
+    assert worst<=2*step, f"Sight distance differs from the brute-force sweep by {worst:.3f}"
+
+def test_earthwork(width=12.0, fill_factor=1.25):
+    import numpy as np
+    from earthwork import earthwork
+    from vertical_profile import VerticalProfile
+    print("\nTesting earthwork against the trapezoid rule on a dense grid")
+    profile=VerticalProfile.from_arrays([0,400,900,1300,1800],[100,108,101,106,100],[0,250,300,200,0])
+    rng=np.random.default_rng(5)
+    ground_stations=np.sort(np.concatenate(([-50.0],rng.uniform(0,1800,60),[1850.0])))
+    ground_elevations=rng.uniform(98,108,len(ground_stations))
+    stations=np.linspace(0,1800,19)
+    result=earthwork(profile,ground_stations,ground_elevations,stations,width,fill_factor)
+    x=np.linspace(0,1800,180001)
+    difference=profile.elevations_at(x)-np.interp(x,ground_stations,ground_elevations)
+    def cumulative(f):
+        return np.concatenate(([0.0],np.cumsum((f[1:]+f[:-1])/2*np.diff(x))))[np.searchsorted(x,stations)]
+    cut=cumulative(np.maximum(-difference,0))*width
+    fill=cumulative(np.maximum(difference,0))*width*fill_factor
+    worst=max(np.abs(result.cut-cut).max(),np.abs(result.fill-fill).max())
+    print(f"Cut {result.cut[-1]:.2f}, fill {result.fill[-1]:.2f}, largest difference from the trapezoid rule {worst:.2e}")
+    assert worst<=1e-6*max(result.cut[-1],result.fill[-1]), f"Earthwork differs from the trapezoid rule by {worst}"
+    assert np.allclose(result.mass,result.cut-result.fill), "The mass ordinate must be cut minus fill"
+
+def test_inverse_queries(count=2000, seed=11):
+    import numpy as np
+    from vertical_profile import VerticalProfile
+    print(f"\nTesting stations_at_elevation/stations_at_slope on {count} random curves")
+    rng=np.random.default_rng(seed)
+    high_low=0
+    for _ in range(count):
+        curve=parabolic.VerticalParabolicCurve().configure(PVI=parabolic.VerticalPoint(rng.uniform(0,50000),rng.uniform(-50,3000)),
+                                                           g1=rng.uniform(-0.06,0.06),g2=rng.uniform(-0.06,0.06),Length=rng.uniform(20,1000))
+        point=curve.High_low_point
+        if point is not None:
+            stations=curve.stations_at_elevation(point.elevation)
+            assert len(stations)==1 and abs(stations[0]-point.station)<=1e-6*curve.Length, f"High/low point {point} gave {stations}"
+            high_low+=1
+        pvc,pvt=curve.PVC,curve.PVT
+        target=rng.uniform(min(pvc.elevation,pvt.elevation),max(pvc.elevation,pvt.elevation))
+        stations=curve.stations_at_elevation(target)
+        assert stations and all(abs(curve.elevation_at(s)-target)<=1e-9*max(1.0,abs(target)) for s in stations), f"Elevation {target} gave {stations}"
+        slope=curve.slope_at(rng.uniform(pvc.station,pvt.station))
+        stations=curve.stations_at_slope(slope)
+        assert len(stations)==1 and abs(curve.slope_at(stations[0])-slope)<=1e-12, f"Slope {slope} gave {stations}"
+    print(f"{high_low} high/low points found exactly once, random elevations and slopes round-trip")
+
+    flat=parabolic.VerticalParabolicCurve().configure(PVI=parabolic.VerticalPoint(1000,100),g1=0.0,g2=0.0,Length=200)
+    profile=VerticalProfile.from_arrays([0,400,900,1300],[100,100,101,106],[0,0,300,0])
+    for query,value in ((flat.stations_at_elevation,100.0),(flat.stations_at_slope,0.0),(profile.stations_at_elevation,100.0)):
+        try:
+            query(value)
+            raise AssertionError(f"{query.__name__}({value}) on a level design must raise ValueError")
+        except ValueError:
+            pass
+    print("Level curves and profiles raise ValueError")
+
+def test_instrumentation():
+    import numpy as np
+    print("\nTesting opt-in instrumentation")
+    cls=parabolic.VerticalParabolicCurve
+    originals={name:cls.__dict__[name] for name in parabolic._INSTRUMENTED}
+    snapshots=[]
+    parabolic.enable_instrumentation(snapshots.append)
+    try:
+        assert parabolic.instrumentation_enabled() and all(cls.__dict__[name] is not method for name,method in originals.items())
+        curve=cls().configure(PVI=parabolic.VerticalPoint(1000,100),g1=0.02,g2=-0.01,Length=200)
+        curve.elevation_at(950)
+        curve.elevation_at(1050)
+        curve.projectpoint_at(parabolic.VerticalPoint(1000,105))
+        curve.elevations_at(np.array([850.0,950.0,1000.0,1150.0]))
+        snapshot=parabolic.instrumentation_snapshot()
+        assert snapshot['elevation_at']['calls']==2, "A projection must not be counted as an elevation_at call"
+        assert snapshot['projectpoint_at']['calls']==1 and snapshot['recompute']['calls']==1
+        assert (snapshot['elevations_at']['items'],snapshot['elevations_at']['out_of_range'])==(4,2)
+        assert parabolic.flush_instrumentation()==snapshots[-1]==snapshot, "flush must send the snapshot to the sink"
+    finally:
+        parabolic.disable_instrumentation()
+    assert len(snapshots)==2 and snapshots[-1]['elevation_at']['calls']==2, "disable must flush to the sink"
+    assert not parabolic.instrumentation_enabled() and all(cls.__dict__[name] is method for name,method in originals.items()), "disable must restore the original methods"
+    curve.elevation_at(950)
+    assert parabolic.instrumentation_snapshot()['elevation_at']['calls']==2, "Counters must not change while instrumentation is off"
+    print("Counters, snapshots, the sink and restoring the original methods work")
+
+def test_curve_server(requests=8):
+    import asyncio
+    import json
+    from curve_server import CurveServer
+    print(f"\nTesting {requests} concurrent /evaluate requests against the curve server")
+    async def run():
+        server=CurveServer(window=0.05)
+        curve={'pvi_station':1000,'pvi_elevation':100,'g1':0.02,'g2':-0.01,'length':200}
+        status,created=await server.dispatch('POST','/curves',curve)
+        assert status==201
+        design=parabolic.VerticalParabolicCurve().configure(PVI=parabolic.VerticalPoint(1000,100),g1=0.02,g2=-0.01,Length=200)
+        queries=[[900.0+10*i,950.0+i,1200.0+i] for i in range(requests)]
+        replies=await asyncio.gather(*(server.dispatch('POST','/evaluate',{'id':created['id'],'stations':q}) for q in queries))
+        assert server.batcher.requests==requests and server.batcher.batches<requests, "Concurrent requests must be batched"
+        for query,(status,reply) in zip(queries,replies):
+            assert status==200 and len(reply['elevations'])==len(query), "Each caller gets its own slice"
+            assert reply['elevations'][:2]==[design.elevation_at(s) for s in query[:2]], "Each caller gets its own results"
+            assert reply['elevations'][2] is None and reply['slopes'][2] is None, "Out of range values must be null"
+            json.dumps(reply,allow_nan=False)
+        status,reply=await server._respond('POST','/solve',json.dumps({'curves':[curve,dict(curve,length=0)]}).encode())
+        assert status==400 and 'length must be positive' in reply['error'], f"/solve must reject a zero length, got {status} {reply}"
+        return server.batcher.batches
+    batches=asyncio.run(run())
+    print(f"{requests} requests answered in {batches} batch(es), NaN sent as null, bad lengths rejected with 400")
+
+def test_curve_cli():
+    import csv
+    import json
+    import curve_cli
+    print("\nTesting the batch CLI on CSV and NDJSON input")
+    folder=tempfile.mkdtemp()
+    def run(name,text,*options):
+        source=os.path.join(folder,name)
+        target=source+'.out'
+        with open(source,'w',newline='') as f:
+            f.write(text)
+        code=curve_cli.main([source,'-o',target,*options])
+        with open(target,newline='') as f:
+            rows=list(csv.DictReader(f)) if name.endswith('.csv') else [json.loads(line) for line in f]
+        return code,rows
+    csv_text=("id,pvi_station,pvi_elevation,g1,g2,length,stations\n"
+              "a,1000,100,0.02,-0.01,200,950;1050\n"
+              "b,2000,110,-0.03,0.01,300,\n"
+              "c,3000,120,0.01,0.02,0,\n"
+              "d,4000,oops,0.01,0.02,100,\n"
+              "e,5000,130,0.0,0.03,150,5000\n")
+    ndjson_text=('{"id":"a","pvi_station":1000,"pvi_elevation":100,"g1":0.02,"g2":-0.01,"length":200,"stations":[950,1050]}\n'
+                 '{"id":"b","pvi_station":2000,"pvi_elevation":110,\n'
+                 '[1,2,3]\n'
+                 '{"id":"d","pvi_station":4000,"g1":0.01,"g2":0.02,"length":100}\n'
+                 '{"id":"e","pvi_station":5000,"pvi_elevation":130,"g1":0.0,"g2":0.03,"length":150,"stations":[5000]}\n')
+    expected={'csv':(['a','b','c','d','e'],[False,False,True,True,False]),'ndjson':(['a',None,None,'d','e'],[False,True,True,True,False])}
+    curve=parabolic.VerticalParabolicCurve().configure(PVI=parabolic.VerticalPoint(1000,100),g1=0.02,g2=-0.01,Length=200)
+    for name,text in (('curves.csv',csv_text),('curves.ndjson',ndjson_text)):
+        kind=name.rsplit('.',1)[1]
+        for options in ((),('--workers','2','--chunk-size','1')):
+            code,rows=run(name,text,*options)
+            ids,errors=expected[kind]
+            assert code==1, f"{name} {options}: failed rows must give exit code 1"
+            assert [r['id'] or None for r in rows]==ids, f"{name} {options}: output is out of order"
+            assert [bool(r.get('error')) for r in rows]==errors, f"{name} {options}: wrong error rows"
+            first=rows[0]['elevations']
+            first=[float(v) for v in first.split(';')] if kind=='csv' else first
+            assert first==[curve.elevation_at(950),curve.elevation_at(1050)], f"{name} {options}: wrong elevations"
+    valid=csv_text.split('\n')
+    code,rows=run('valid.csv','\n'.join(valid[:3]+valid[5:]),'--workers','2','--chunk-size','1')
+    assert code==0 and len(rows)==3, "A file without errors must give exit code 0"
+    print("In-process and two-worker runs keep input order, report malformed lines as error rows and exit with 1 on errors")
+
+def test_curve_cache():
+    from curve_cache import CurveSolutionCache
+    print("\nTesting the curve solution cache")
+    cache=CurveSolutionCache(capacity=2)
+    point=parabolic.VerticalPoint
+    first=cache.solve(point(1000,100),0.02,-0.01,200)
+    assert cache.key(1000,100,0.02,-0.01,200)==cache.key(1000+1e-8,100-1e-8,0.02+1e-11,-0.01,200+1e-8), "Inputs within tolerance must share a key"
+    assert cache.solve(point(1000+1e-8,100),0.02+1e-11,-0.01,200) is first, "A near-identical curve must hit the cache"
+    expected=parabolic.VerticalParabolicCurve().configure(PVI=point(1000,100),g1=0.02,g2=-0.01,Length=200).solution()
+    assert first==expected
+    cache.solve(point(2000,110),0.01,0.03,300)
+    cache.solve(point(1000,100),0.02,-0.01,200)     #Makes the first curve the most recently used
+    cache.solve(point(3000,120),-0.02,0.01,250)     #Evicts the second curve
+    assert len(cache)==2 and cache.get(cache.key(2000,110,0.01,0.03,300)) is None, "The least recently used entry must be evicted"
+    assert cache.get(cache.key(1000,100,0.02,-0.01,200)) is first
+    stats=cache.stats()
+    assert (stats['hits'],stats['misses'],stats['evictions'],stats['size'])==(3,4,1,2), f"Unexpected counters {stats}"
+    assert stats['hit_rate']==3/7
+    cache.clear()
+    assert len(cache)==0 and cache.stats()['hit_rate']==0.0
+    print(f"Tolerant keys, LRU eviction and counters work (hit rate {stats['hit_rate']:.2f})")
+
+def test_minimum_length():
+    import numpy as np
+    from design import minimum_length
+    print("\nTesting minimum curve lengths against hand-computed AASHTO values")
+    # (g1, g2, S, L): crest L=A*S**2/658 or 2*S-658/A, sag L=A*S**2/(120+3.5*S) or 2*S-(120+3.5*S)/A
+    cases=((0.03,-0.03,130,6*130**2/658),      #Crest, S<L
+           (0.015,-0.015,130,2*130-658/3),     #Crest, S>L
+           (-0.03,0.03,130,6*130**2/(120+3.5*130)),   #Sag, S<L
+           (-0.015,0.015,130,2*130-(120+3.5*130)/3),  #Sag, S>L
+           (0.01,-0.005,60,0.0),               #Crest too gentle to need a curve
+           (0.02,0.02,130,0.0))                #No grade change
+    g1,g2,S,expected=(np.array(column,dtype=float) for column in zip(*cases))
+    lengths=minimum_length(g1,g2,S)
+    for case,length in zip(cases,lengths):
+        print(f"g1={case[0]}, g2={case[1]}, S={case[2]}: L={length:.2f} (hand {case[3]:.2f})")
+    #AASHTO rounds 200*tan(1 degree) to 3.5 and 200*(sqrt(1.08)+sqrt(0.6))**2 to 658
+    assert np.allclose(lengths,expected,rtol=1e-2,atol=0), "Minimum lengths differ from the AASHTO formulas"
+
 if __name__=="__main__":
     #Test case 1
-    test_vertical_curve(pvi_station=12000, pvi_elevation=135, length=1600, g1=0.0175, g2=-0.01, station=11360)
\ No newline at end of file
+    test_vertical_curve(pvi_station=12000, pvi_elevation=135, length=1600, g1=0.0175, g2=-0.01, station=11360)
+    #Test case 2: a zero grade still initializes the curve
+    test_vertical_curve(pvi_station=1000, pvi_elevation=100, length=200, g1=0.0, g2=0.03, station=950)
+    #Import-time budget of the headless core
+    test_import_budget()
+    #Binary curve files
+    test_curve_file()
+    #Profile edits against rebuilt profiles
+    test_profile_edits()
+    #Sight distance against a brute-force sweep
+    test_sight_distance()
+    #Earthwork against the trapezoid rule
+    test_earthwork()
+    #Inverse queries
+    test_inverse_queries()
+    #Instrumentation
+    test_instrumentation()
+    #Evaluation server
+    test_curve_server()
+    #Batch CLI
+    test_curve_cli()
+    #Curve solution cache
+    test_curve_cache()
+    #Minimum curve lengths
+    test_minimum_length()
\ No newline at end of file
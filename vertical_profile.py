@@ -0,0 +1,381 @@
+from bisect import bisect_right
+from typing import Callable, NamedTuple, Optional, Sequence
+import logging
+import numpy as np
+from parabolic import VerticalParabolicCurve, VerticalPoint, elevation_crossings, slope_crossings
+
+
+class ProfileSegment(NamedTuple):
+    "A tangent or curve piece of a vertical profile"
+    kind:str    #'tangent' or 'curve'
+    index:int   #Tangent i runs from PVI i to PVI i+1, curve i sits on PVI i
+    start:float #Station where the piece begins
+    end:float   #Station where the piece ends
+
+
+class ProfileChange(NamedTuple):
+    "An edit of a vertical profile, as passed to subscribers"
+    kind:str        #'move', 'insert', 'remove' or 'length'
+    index:int       #Index of the edited PVI (for 'remove', the index it had)
+    start:float     #First station whose elevation may have changed
+    end:float       #Last station whose elevation may have changed
+    revision:int    #Revision of the profile after the edit
+
+
+class VerticalProfile:
+    # Models a vertical alignment as tangents joined by parabolic curves at the PVIs
+    #
+    # The profile is stored as a fixed sequence of pieces T0, C1, T1, C2, ... T(n-2):
+    # tangent i has piece index 2*i and the curve on PVI j has piece index 2*j-1.
+    # Each piece k keeps its start station, the elevation and grade at that station
+    # and the half rate of grade change, so elevation = e + g*u + a*u**2 with u=station-start.
+    #
+    # Editing a PVI only changes the grades on either side of it, so the edit methods
+    # rebuild the pieces from the curve before it to the curve after it (at most five)
+    # and tell subscribers which station range changed.
+
+    def __init__(self, pvis:Sequence[VerticalPoint], lengths:Optional[Sequence[float]]=None):
+        "Create a profile from an ordered list of PVIs and a curve length per PVI"
+        if pvis is None or len(pvis)<2:
+            raise ValueError("A profile needs at least two PVIs")
+        self._setup(np.array([p.station for p in pvis],dtype=float),np.array([p.elevation for p in pvis],dtype=float),lengths)
+
+    @classmethod
+    def from_arrays(cls, stations, elevations, lengths=None) ->'VerticalProfile':
+        'Create a profile from arrays of PVI stations, PVI elevations and curve lengths'
+        profile=cls.__new__(cls)
+        profile._setup(np.array(stations,dtype=float),np.array(elevations,dtype=float),lengths)
+        return profile
+
+    def _setup(self, stations:np.ndarray, elevations:np.ndarray, lengths):
+        'Store the PVI arrays and build the pieces'
+        if len(stations)<2 or len(elevations)!=len(stations):
+            raise ValueError("A profile needs at least two PVIs")
+        if lengths is None:
+            lengths=np.zeros(len(stations))
+        if len(lengths)!=len(stations):
+            raise ValueError("There must be one curve length per PVI")
+        self._stations=stations
+        self._elevations=elevations
+        self._lengths=np.array(lengths,dtype=float)
+        self._revision=0
+        self._listeners=[]
+        self._validate()
+        self._grades=np.diff(self._elevations)/np.diff(self._stations)
+        count=2*len(stations)-3
+        self._piece_start=np.empty(count)
+        self._piece_elevation=np.empty(count)
+        self._piece_grade=np.empty(count)
+        self._piece_rate=np.empty(count)
+        self._update_pieces(0,count)
+
+    def _validate(self,first:int=0,last:Optional[int]=None):
+        'Check that the stations increase and that adjacent curves do not overlap, for the PVIs first..last-1'
+        first=max(first,0)
+        stations=self._stations[first:last]
+        lengths=self._lengths[first:last]
+        if np.any(np.diff(stations)<=0):
+            raise ValueError("PVI stations must be strictly increasing")
+        if np.any(lengths<0):
+            raise ValueError("Curve lengths cannot be negative")
+        if self._lengths[0]!=0 or self._lengths[-1]!=0:
+            raise ValueError("The first and last PVI cannot carry a curve")
+        gaps=np.diff(stations)-(lengths[:-1]+lengths[1:])/2
+        if np.any(gaps<-1e-9):
+            raise ValueError("Adjacent vertical curves overlap")
+
+    def _update_pieces(self,first:int,last:int):
+        'Recalculate the pieces with index first..last-1 from the PVIs and grades'
+        first=max(first,0)
+        last=min(last,len(self._piece_start))
+        for k in range(first,last):
+            i=(k+1)//2
+            half=self._lengths[i]/2
+            if k%2==0:
+                self._piece_start[k]=self._stations[i]+half
+                self._piece_elevation[k]=self._elevations[i]+self._grades[i]*half
+                self._piece_grade[k]=self._grades[i]
+                self._piece_rate[k]=0.0
+            else:
+                g1=self._grades[i-1]
+                g2=self._grades[i]
+                self._piece_start[k]=self._stations[i]-half
+                self._piece_elevation[k]=self._elevations[i]-g1*half
+                self._piece_grade[k]=g1
+                self._piece_rate[k]=(g2-g1)/(2*self._lengths[i]) if self._lengths[i]>0 else 0.0
+        if first==0 and last==len(self._piece_start):
+            self._starts=self._piece_start.tolist()
+        else:
+            self._starts[first:last]=self._piece_start[first:last].tolist()
+
+    def _update_grades(self,first:int,last:int):
+        'Recalculate the tangent grades with index first..last-1'
+        first=max(first,0)
+        last=min(last,len(self._grades))
+        self._grades[first:last]=np.diff(self._elevations[first:last+1])/np.diff(self._stations[first:last+1])
+
+    def _span(self,first:int,last:int) ->tuple:
+        'Get the station range covered by the pieces first..last-1'
+        count=len(self._piece_start)
+        start=self._piece_start[first] if 0<first<count else self._stations[0] if first<=0 else self._stations[-1]
+        end=self._piece_start[last] if 0<last<count else self._stations[-1] if last>=count else self._stations[0]
+        return float(start),float(end)
+
+    # Editing
+
+    @property
+    def revision(self) ->int:
+        "Get a counter that increases with every edit"
+        return self._revision
+
+    def subscribe(self,callback:Callable[[ProfileChange],None]) ->Callable[[ProfileChange],None]:
+        'Call callback with a ProfileChange after every edit'
+        self._listeners.append(callback)
+        return callback
+
+    def unsubscribe(self,callback:Callable[[ProfileChange],None]):
+        'Stop sending edits to a subscribed callback'
+        self._listeners.remove(callback)
+
+    def _changed(self,kind:str,index:int,old:tuple,new:tuple):
+        self._revision+=1
+        change=ProfileChange(kind,index,min(old[0],new[0]),max(old[1],new[1]),self._revision)
+        for callback in list(self._listeners):
+            callback(change)
+
+    def move_pvi(self,index:int,station:Optional[float]=None,elevation:Optional[float]=None):
+        'Move a PVI (either coordinate may be left as is), updating only the neighbouring pieces'
+        n=len(self._stations)
+        if not -n<=index<n:
+            raise IndexError("PVI index out of range")
+        index%=n
+        old_station,old_elevation=self._stations[index],self._elevations[index]
+        first,last=2*index-3,2*index+2
+        old=self._span(first,last)
+        if station is not None:
+            self._stations[index]=station
+        if elevation is not None:
+            self._elevations[index]=elevation
+        try:
+            self._validate(index-1,index+2)
+        except ValueError:
+            self._stations[index],self._elevations[index]=old_station,old_elevation
+            raise
+        self._update_grades(index-1,index+1)
+        self._update_pieces(first,last)
+        self._changed('move',index,old,self._span(first,last))
+
+    def set_length(self,index:int,length:float):
+        'Change the curve length on an interior PVI, updating only that curve and its tangents'
+        n=len(self._stations)
+        if not -n<=index<n:
+            raise IndexError("PVI index out of range")
+        index%=n
+        old_length=self._lengths[index]
+        first,last=2*index-2,2*index+1
+        old=self._span(first,last)
+        self._lengths[index]=length
+        try:
+            self._validate(index-1,index+2)
+        except ValueError:
+            self._lengths[index]=old_length
+            raise
+        self._update_pieces(first,last)
+        self._changed('length',index,old,self._span(first,last))
+
+    def insert_pvi(self,pvi:VerticalPoint,length:float=0.0) ->int:
+        'Insert a PVI at its station (before the first or after the last PVI extends the profile) and return its index'
+        index=int(np.searchsorted(self._stations,pvi.station))
+        if index<len(self._stations) and self._stations[index]==pvi.station:
+            raise ValueError("There is already a PVI at this station")
+        stations=np.insert(self._stations,index,pvi.station)
+        elevations=np.insert(self._elevations,index,pvi.elevation)
+        lengths=np.insert(self._lengths,index,length)
+        old=self._span(2*index-3,2*index)
+        arrays=self._stations,self._elevations,self._lengths
+        self._stations,self._elevations,self._lengths=stations,elevations,lengths
+        try:
+            self._validate(index-1,index+2)
+        except ValueError:
+            self._stations,self._elevations,self._lengths=arrays
+            raise
+        self._grades=np.insert(self._grades,min(index,len(self._grades)),0.0)
+        self._update_grades(index-1,index+1)
+        # The new PVI adds a curve and a tangent; the later pieces shift by two
+        position=min(max(2*index-1,0),len(self._piece_start))
+        self._piece_start=np.insert(self._piece_start,position,[0.0,0.0])
+        self._piece_elevation=np.insert(self._piece_elevation,position,[0.0,0.0])
+        self._piece_grade=np.insert(self._piece_grade,position,[0.0,0.0])
+        self._piece_rate=np.insert(self._piece_rate,position,[0.0,0.0])
+        self._starts[position:position]=[0.0,0.0]
+        self._update_pieces(2*index-3,2*index+2)
+        self._changed('insert',index,old,self._span(2*index-3,2*index+2))
+        return index
+
+    def remove_pvi(self,index:int):
+        'Remove a PVI, joining the tangents on either side of it'
+        n=len(self._stations)
+        if not -n<=index<n:
+            raise IndexError("PVI index out of range")
+        if n<=2:
+            raise ValueError("A profile needs at least two PVIs")
+        index%=n
+        if (index==0 and self._lengths[1]!=0) or (index==n-1 and self._lengths[-2]!=0):
+            raise ValueError("The PVI that becomes the first or last one cannot carry a curve")
+        old=self._span(2*index-3,2*index+2)
+        self._stations=np.delete(self._stations,index)
+        self._elevations=np.delete(self._elevations,index)
+        self._lengths=np.delete(self._lengths,index)
+        self._grades=np.delete(self._grades,min(index,len(self._grades)-1))
+        self._update_grades(index-1,index)
+        position=min(max(2*index-1,0),len(self._piece_start)-2)
+        self._piece_start=np.delete(self._piece_start,[position,position+1])
+        self._piece_elevation=np.delete(self._piece_elevation,[position,position+1])
+        self._piece_grade=np.delete(self._piece_grade,[position,position+1])
+        self._piece_rate=np.delete(self._piece_rate,[position,position+1])
+        del self._starts[position:position+2]
+        self._update_pieces(2*index-3,2*index+1)
+        self._changed('remove',index,old,self._span(2*index-3,2*index+1))
+
+    @property
+    def PVIs(self) ->list:
+        "Get the points of vertical intersection"
+        return [VerticalPoint(s,e) for s,e in zip(self._stations.tolist(),self._elevations.tolist())]
+
+    @property
+    def pvi_stations(self) ->np.ndarray:
+        "Get the station of each PVI"
+        return self._stations.copy()
+
+    @property
+    def pvi_elevations(self) ->np.ndarray:
+        "Get the elevation of each PVI"
+        return self._elevations.copy()
+
+    @property
+    def lengths(self) ->np.ndarray:
+        "Get the curve length at each PVI"
+        return self._lengths.copy()
+
+    @property
+    def grades(self) ->np.ndarray:
+        "Get the grade of each tangent between consecutive PVIs"
+        return self._grades.copy()
+
+    @property
+    def start_station(self) ->float:
+        "Get the first station of the profile"
+        return float(self._stations[0])
+
+    @property
+    def end_station(self) ->float:
+        "Get the last station of the profile"
+        return float(self._stations[-1])
+
+    def __len__(self) ->int:
+        return len(self._stations)
+
+    def pieces(self) ->tuple:
+        'Get the tangent and curve pieces: (starts, ends, elevations, grades, half rates) arrays'
+        ends=np.append(self._piece_start[1:],self._stations[-1])
+        return self._piece_start.copy(),ends,self._piece_elevation.copy(),self._piece_grade.copy(),self._piece_rate.copy()
+
+    def stations_at_elevation(self,elevation:float) ->np.ndarray:
+        'Find all stations where the profile reaches an elevation, in increasing order (ValueError if a level piece lies at it)'
+        starts,ends,elevations,grades,rates=self.pieces()
+        level=(ends>starts)&(rates==0)&(grades==0)&(elevations==elevation)
+        if level.any():
+            k=int(np.argmax(level))
+            raise ValueError(f"The profile is level at this elevation from station {starts[k]} to {ends[k]}")
+        roots=elevation_crossings(starts,elevations,grades,rates,ends,elevation)
+        return np.unique(roots[~np.isnan(roots)])
+
+    def stations_at_slope(self,slope:float) ->np.ndarray:
+        'Find all stations on the vertical curves where the profile reaches a slope, in increasing order (ValueError if a curve has a constant grade equal to it)'
+        starts,ends,elevations,grades,rates=self.pieces()
+        constant=(np.arange(len(starts))%2==1)&(ends>starts)&(rates==0)&(grades==slope)
+        if constant.any():
+            k=int(np.argmax(constant))
+            raise ValueError(f"The curve from station {starts[k]} to {ends[k]} has a constant grade equal to this slope")
+        stations=slope_crossings(starts,elevations,grades,rates,ends,slope)
+        return np.unique(stations[~np.isnan(stations)])
+
+    def _piece_at(self,station:float) ->Optional[int]:
+        'Find the index of the piece containing a station, None outside the profile'
+        if station<self._stations[0] or station>self._stations[-1]:
+            logging.warning("Station must be within the profile")
+            return None
+        return max(min(bisect_right(self._starts,station)-1,len(self._starts)-1),0)
+
+    def segment_at(self,station:float) ->Optional[ProfileSegment]:
+        'Find the tangent or curve a station lies on'
+        k=self._piece_at(station)
+        if k is None:
+            return None
+        end=self._piece_start[k+1] if k+1<len(self._piece_start) else self._stations[-1]
+        return ProfileSegment('tangent' if k%2==0 else 'curve',(k+1)//2 if k%2 else k//2,float(self._piece_start[k]),float(end))
+
+    def elevation_at(self,station:float) ->float:
+        'Calculate the elevation at a given station along the profile'
+        k=self._piece_at(station)
+        if k is None:
+            return None
+        u=station-self._piece_start[k]
+        return float(self._piece_elevation[k]+(self._piece_grade[k]+self._piece_rate[k]*u)*u)
+
+    def slope_at(self,station:float) ->float:
+        'Calculate the slope at a given station along the profile'
+        k=self._piece_at(station)
+        if k is None:
+            return None
+        return float(self._piece_grade[k]+2*self._piece_rate[k]*(station-self._piece_start[k]))
+
+    def _locate(self,stations):
+        'Find the piece index and offset of each station, with a mask of stations outside the profile'
+        stations=np.asarray(stations,dtype=float)
+        count=len(self._piece_start)
+        if stations.ndim==1 and stations.size>count and np.all(stations[1:]>=stations[:-1]):
+            # Sorted queries (a corridor walk): split them at the piece starts instead of
+            # searching each one, O(m + n log m) for m stations and n pieces
+            first=np.searchsorted(stations,self._piece_start,side='left')
+            k=np.repeat(np.arange(count),np.diff(np.append(first,stations.size)))
+            k=np.concatenate((np.zeros(first[0],dtype=k.dtype),k))
+        else:
+            k=np.clip(np.searchsorted(self._piece_start,stations,side='right')-1,0,count-1)
+        outside=(stations<self._stations[0])|(stations>self._stations[-1])
+        return k,stations-self._piece_start[k],outside
+
+    def segments_at(self,stations) ->np.ndarray:
+        'Find the piece index of an array of stations, -1 outside the profile'
+        k,_,outside=self._locate(stations)
+        return np.where(outside,-1,k)
+
+    def elevations_at(self,stations) ->np.ndarray:
+        'Calculate the elevations at an array of stations, NaN outside the profile'
+        k,u,outside=self._locate(stations)
+        elevations=self._piece_elevation[k]+(self._piece_grade[k]+self._piece_rate[k]*u)*u
+        return np.where(outside,np.nan,elevations)
+
+    def slopes_at(self,stations) ->np.ndarray:
+        'Calculate the slopes at an array of stations, NaN outside the profile'
+        k,u,outside=self._locate(stations)
+        slopes=self._piece_grade[k]+2*self._piece_rate[k]*u
+        return np.where(outside,np.nan,slopes)
+
+    def project_points(self,stations,elevations,clamp:bool=True) ->tuple:
+        'Project arrays of points onto the profile and return the design elevations and the vertical offsets (point minus design)'
+        stations=np.asarray(stations,dtype=float)
+        if clamp:
+            stations=np.clip(stations,self._stations[0],self._stations[-1])
+        design=self.elevations_at(stations)
+        return design,np.asarray(elevations,dtype=float)-design
+
+    def curve_at(self,index:int) ->VerticalParabolicCurve:
+        'Build the standalone vertical curve on an interior PVI'
+        if index<=0 or index>=len(self._stations)-1:
+            raise ValueError("Only interior PVIs carry a vertical curve")
+        if self._lengths[index]<=0:
+            raise ValueError("The PVI has no vertical curve")
+        return VerticalParabolicCurve().configure(PVI=VerticalPoint(float(self._stations[index]),float(self._elevations[index])),
+                                                  g1=float(self._grades[index-1]),g2=float(self._grades[index]),
+                                                  Length=float(self._lengths[index]))